@@ -44,9 +44,10 @@ def getRandomAndChecksum(backend, data):
     :param backend: the backend to send the data to.
     :param data: the data, as bytes.
     """
-    secret = config.getBackendSecret(backend).encode()
+    secret = config.getBackendSecretBytes(backend)
     random = token_urlsafe(64)
-    hmacValue = hmac.new(secret, random.encode() + data, hashlib.sha256)
+    hmacValue = hmac.new(secret, random.encode(), hashlib.sha256)
+    hmacValue.update(data)
 
     return random, hmacValue.hexdigest()
 
@@ -27,12 +27,137 @@ loaded with the configuration file at startup.
 
 import logging
 import os
-
+import socket
+import sys
+from dataclasses import dataclass
 from ipaddress import ip_network
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import urlsplit, urlunsplit
+
+from . import FastIni
+
+_logger = logging.getLogger(__name__)
+
+def _splitList(value):
+    """
+    Returns the items of a comma separated list, without surrounding
+    whitespaces and ignoring empty items.
+    """
+    return [item for item in (item.strip() for item in value.split(',')) if item]
+
+def _splitIds(value):
+    """
+    Returns the ids of a comma separated list of section names as a tuple.
+
+    The ids are interned, like the parsed section names, so looking up their
+    sections can compare them by identity.
+    """
+    return tuple(sys.intern(item) for item in _splitList(value))
+
+def _withoutScope(value):
+    """
+    Returns the given IP network without the IPv6 scope of its address, if any.
+
+    The scope is ignored when checking whether an address belongs to a network,
+    so it is removed rather than being parsed differently depending on the
+    Python version (IPv6Network accepts it only since Python 3.9).
+    """
+    address, separator, prefixLength = value.partition('/')
+
+    return address.partition('%')[0] + separator + prefixLength
+
+def _looksLikeIpOrCidr(value):
+    """
+    Returns whether the given value could be an IP network.
+
+    Only the address part (without prefix length and without IPv6 scope) is
+    checked with inet_pton. This is much cheaper than trying to create an
+    IPv4Network or IPv6Network, which also raises an error if that fails. The
+    network could still be invalid even if True is returned (for example, due
+    to an invalid prefix length).
+    """
+    address = _withoutScope(value).partition('/')[0]
+
+    try:
+        socket.inet_pton(socket.AF_INET6 if ':' in address else socket.AF_INET, address)
+    except (OSError, ValueError):
+        # inet_pton raises ValueError rather than OSError if the address
+        # contains an embedded null character.
+        return False
+
+    return True
+
+@lru_cache(maxsize=None)
+def _getDefaultStatsAllowedIp():
+    """
+    Returns the network allowed to query the stats by default (127.0.0.1).
+
+    The network is created only once, the first time that it is needed.
+    """
+    return ip_network('127.0.0.1')
+
+# Values used for the backends when neither the backend nor the default values
+# of all the backends set them.
+_BACKEND_DEFAULTS = {
+    'skipverify': 'false',
+    'maxmessagesize': '1024',
+    'videowidth': '1920',
+    'videoheight': '1080',
+    'directory': '/tmp',
+}
+
+@dataclass(frozen=True)
+class BackendConfig:
+    """
+    All the configuration values of a backend, already resolved and converted to
+    their type.
+    """
+
+    # Slots are explicitly declared, as "dataclass(slots=True)" is not available
+    # in Python 3.8.
+    __slots__ = (
+        'secret',
+        'secretBytes',
+        'skipVerify',
+        'maximumMessageSize',
+        'videoWidth',
+        'videoHeight',
+        'directory',
+    )
+
+    secret: str
+    secretBytes: bytes
+    skipVerify: bool
+    maximumMessageSize: int
+    videoWidth: int
+    videoHeight: int
+    directory: str
+
+@lru_cache(maxsize=256)
+def _canonicalizeUrl(url):
+    """
+    Returns the URL with lower case scheme and host and without trailing "/",
+    interned.
 
-from configparser import ConfigParser
+    The path is kept as is, as several backends may be served from the same
+    host. The URLs of the backends and signaling servers are canonicalized and
+    interned when loaded, so the same string object is used as key when the
+    requested URL matches.
 
-class Config:
+    Malformed URLs (which can be received in requests) are only stripped of
+    the trailing "/", so they are treated as unknown backends rather than
+    failing.
+    """
+    try:
+        splitUrl = urlsplit(url)
+        url = urlunsplit((splitUrl.scheme.lower(), splitUrl.netloc.lower(), splitUrl.path, splitUrl.query, splitUrl.fragment))
+    except ValueError:
+        pass
+
+    return sys.intern(url.rstrip('/'))
+
+class Config: # pylint: disable=too-many-public-methods
     """
     Class for the configuration.
 
@@ -46,123 +171,321 @@ class Config:
     """
 
     def __init__(self):
-        self._logger = logging.getLogger(__name__)
+        self._loadedFile = None
 
-        self._configParser = ConfigParser()
+        self._sections = MappingProxyType({})
 
-        self._trustedProxies = []
+        self._trustedProxies = ()
+        self._backendAllowAll = False
+        self._backendAllowAllSecret = None
+        self._backendIds = ()
         self._backendIdsByBackendUrl = {}
+        self._backendConfigsByBackendId = {}
+        self._signalingIds = ()
         self._signalingIdsBySignalingUrl = {}
-        self._statsAllowedIps = []
+        self._signalingSecretsBySignalingUrl = {}
+        self._defaultSignalingSecret = None
+        self._statsAllowedIps = ()
+
+        self._loadFfmpeg()
 
-    def load(self, fileName):
+        # The generation is part of the keys of the lookups by backend or
+        # signaling URL, so values cached before loading the configuration
+        # again are no longer used (and they are eventually evicted). The
+        # caches belong to each instance rather than to the methods.
+        self._generation = 0
+        self._cachedBackendConfigLookup = lru_cache(maxsize=128)(self._lookupBackendConfig)
+        self._cachedSignalingSecretLookup = lru_cache(maxsize=128)(self._lookupSignalingSecret)
+
+    def load(self, fileName, force=False):
         """
         Loads the configuration from the given file name.
 
+        If the same file was already loaded and it has not been modified since
+        then (same modification time and size) the configuration is not loaded
+        again, unless explicitly forced.
+
         :param fileName: the absolute or relative (to the current working
                directory) path to the configuration file.
+        :param force: True to load the file even if it was not modified.
         """
         fileName = os.path.abspath(fileName)
 
-        if not os.path.exists(fileName):
-            self._logger.warning("Configuration file not found: %s", fileName)
+        try:
+            fileStat = os.stat(fileName)
+            loadedFile = (fileName, fileStat.st_mtime_ns, fileStat.st_size)
+        except OSError:
+            loadedFile = None
+
+        if not force and loadedFile is not None and loadedFile == self._loadedFile:
+            _logger.debug("Not loading %s again, it was not modified", fileName)
+
+            return
+
+        if loadedFile is None:
+            _logger.warning("Configuration file not found: %s", fileName)
         else:
-            self._logger.info("Loading %s", fileName)
+            _logger.info("Loading %s", fileName)
 
-        self._configParser.read(fileName)
+        self._loadFromText(self._readFile(fileName), fileName)
+
+        self._loadedFile = loadedFile
+
+    def loadFromString(self, text):
+        """
+        Loads the configuration from the given string.
+
+        The string is always loaded, even if it is the same one loaded before.
+
+        :param text: the configuration, in the same format as the configuration
+               file.
+        """
+        self._loadFromText(text, '<string>')
+
+        self._loadedFile = None
+
+    def _loadFromText(self, text, fileName):
+        # The parsed sections are read-only, as the BackendConfigs and other
+        # values resolved from them are kept until the configuration is
+        # loaded again.
+        self._sections = MappingProxyType({
+            sectionName: MappingProxyType(section) for sectionName, section in self._parse(text, fileName).items()
+        })
 
         self._loadTrustedProxies()
         self._loadBackends()
         self._loadSignalings()
+        self._loadSignalingSecrets()
         self._loadStatsAllowedIps()
+        self._loadFfmpeg()
+
+        self._generation += 1
+
+    def _readFile(self, fileName):
+        """
+        Returns the contents of the given file, or an empty string if it can not
+        be read.
+        """
+        try:
+            with open(fileName, encoding='utf-8') as configFile:
+                return configFile.read()
+        except OSError:
+            return ''
+
+    def _parse(self, text, fileName):
+        """
+        Returns the sections in the given configuration text as plain dicts.
+
+        The text is parsed with FastIni, as it is faster than ConfigParser. If
+        the text uses syntax not supported by FastIni it is parsed again with
+        ConfigParser instead.
+
+        In both cases the section names and the keys are interned, so looking
+        them up with the string literals used in the code is faster.
+        """
+        try:
+            return FastIni.parse(text)
+        except ValueError as valueError:
+            _logger.debug("Parsing %s with ConfigParser: %s", fileName, valueError)
+
+        # pylint: disable=import-outside-toplevel
+        from configparser import ConfigParser
+
+        configParser = ConfigParser()
+        configParser.read_string(text, fileName)
+
+        sections = {}
+        for section in configParser.sections():
+            sections[sys.intern(section)] = {sys.intern(key): value for key, value in configParser.items(section)}
+
+        return sections
 
     def _loadTrustedProxies(self):
-        self._trustedProxies = []
+        self._trustedProxies = ()
 
-        if 'app' not in self._configParser or 'trustedproxies' not in self._configParser['app']:
+        if 'trustedproxies' not in self._sections.get('app', {}):
             return
 
-        trustedProxies = self._configParser.get('app', 'trustedproxies')
-        trustedProxies = [trustedProxy.strip() for trustedProxy in trustedProxies.split(',')]
+        trustedProxies = self._sections['app']['trustedproxies']
+        trustedProxies = _splitList(trustedProxies)
 
+        validTrustedProxies = []
         for trustedProxy in trustedProxies:
+            if not _looksLikeIpOrCidr(trustedProxy):
+                _logger.error("Invalid trusted proxy: %r does not appear to be an IPv4 or IPv6 network", trustedProxy)
+                continue
+
             try:
-                trustedProxy = ip_network(trustedProxy)
+                trustedProxy = ip_network(_withoutScope(trustedProxy))
 
-                self._trustedProxies.append(trustedProxy)
+                validTrustedProxies.append(trustedProxy)
             except ValueError as valueError:
-                self._logger.error("Invalid trusted proxy: %s", valueError)
+                _logger.error("Invalid trusted proxy: %s", valueError)
+
+        # The networks are frozen so they can be shared with the callers
+        # without copying them.
+        self._trustedProxies = tuple(validTrustedProxies)
 
     def _loadBackends(self):
+        self._backendAllowAll = self._sections.get('backend', {}).get('allowall') == 'true'
+        self._backendAllowAllSecret = self._sections.get('backend', {}).get('secret')
+
+        self._backendIds = ()
         self._backendIdsByBackendUrl = {}
+        # The BackendConfigs are resolved when first looked up, as usually
+        # only some of the backends are used.
+        self._backendConfigsByBackendId = {}
 
-        if 'backend' not in self._configParser or 'backends' not in self._configParser['backend']:
-            self._logger.warning("No configured backends")
+        if 'backends' not in self._sections.get('backend', {}):
+            _logger.warning("No configured backends")
 
             return
 
-        backendIds = self._configParser.get('backend', 'backends')
-        backendIds = [backendId.strip() for backendId in backendIds.split(',')]
+        self._backendIds = _splitIds(self._sections['backend']['backends'])
 
-        for backendId in backendIds:
-            if 'url' not in self._configParser[backendId]:
-                self._logger.error("Missing 'url' property for backend %s", backendId)
+        for backendId in self._backendIds:
+            section = self._sections.get(backendId, {})
+
+            url = section.get('url')
+            if not url:
+                _logger.error("Missing 'url' property for backend %s", backendId)
                 continue
 
-            if 'secret' not in self._configParser[backendId]:
-                self._logger.error("Missing 'secret' property for backend %s", backendId)
+            if 'secret' not in section:
+                _logger.error("Missing 'secret' property for backend %s", backendId)
                 continue
 
-            backendUrl = self._configParser[backendId]['url'].rstrip('/')
+            backendUrl = _canonicalizeUrl(url)
             self._backendIdsByBackendUrl[backendUrl] = backendId
 
+    def _getBackendConfigById(self, backendId):
+        """
+        Returns the BackendConfig of the given backend (or of the default
+        backend if None), resolving it if it was not resolved yet since the
+        configuration was loaded.
+        """
+        backendConfig = self._backendConfigsByBackendId.get(backendId)
+        if backendConfig is None:
+            backendConfig = self._resolveBackendConfig(backendId)
+            self._backendConfigsByBackendId[backendId] = backendConfig
+
+        return backendConfig
+
+    def _resolveBackendConfig(self, backendId):
+        """
+        Returns the BackendConfig of the given backend (or of the default
+        backend if None).
+
+        Values not set (or empty) in the backend are got from the default
+        values of all the backends, and values not set in those either are got
+        from the hardcoded defaults.
+        """
+        backendConfig = dict(_BACKEND_DEFAULTS)
+        backendConfig.update(self._sections.get('backend', {}))
+
+        for key, value in self._sections.get(backendId, {}).items():
+            if value:
+                backendConfig[key] = value
+
+        if self._backendAllowAll:
+            secret = self._backendAllowAllSecret
+        elif backendId is not None:
+            secret = self._sections[backendId].get('secret')
+        else:
+            secret = None
+
+        return BackendConfig(
+            secret=secret,
+            secretBytes=secret.encode() if secret is not None else None,
+            skipVerify=backendConfig['skipverify'] == 'true',
+            maximumMessageSize=int(backendConfig['maxmessagesize']),
+            videoWidth=int(backendConfig['videowidth']),
+            videoHeight=int(backendConfig['videoheight']),
+            directory=backendConfig['directory'],
+        )
+
     def _loadSignalings(self):
+        self._signalingIds = ()
         self._signalingIdsBySignalingUrl = {}
 
-        if 'signaling' not in self._configParser:
-            self._logger.warning("No configured signalings")
+        if 'signaling' not in self._sections:
+            _logger.warning("No configured signalings")
 
             return
 
-        if 'signalings' not in self._configParser['signaling']:
-            if 'internalsecret' not in self._configParser['signaling']:
-                self._logger.warning("No configured signalings")
+        if 'signalings' not in self._sections['signaling']:
+            if 'internalsecret' not in self._sections['signaling']:
+                _logger.warning("No configured signalings")
 
             return
 
-        signalingIds = self._configParser.get('signaling', 'signalings')
-        signalingIds = [signalingId.strip() for signalingId in signalingIds.split(',')]
+        self._signalingIds = _splitIds(self._sections['signaling']['signalings'])
+
+        for signalingId in self._signalingIds:
+            section = self._sections.get(signalingId, {})
 
-        for signalingId in signalingIds:
-            if 'url' not in self._configParser[signalingId]:
-                self._logger.error("Missing 'url' property for signaling %s", signalingId)
+            url = section.get('url')
+            if not url:
+                _logger.error("Missing 'url' property for signaling %s", signalingId)
                 continue
 
-            if 'internalsecret' not in self._configParser[signalingId]:
-                self._logger.error("Missing 'internalsecret' property for signaling %s", signalingId)
+            if 'internalsecret' not in section:
+                _logger.error("Missing 'internalsecret' property for signaling %s", signalingId)
                 continue
 
-            signalingUrl = self._configParser[signalingId]['url'].rstrip('/')
+            signalingUrl = _canonicalizeUrl(url)
             self._signalingIdsBySignalingUrl[signalingUrl] = signalingId
 
-    def _loadStatsAllowedIps(self):
-        self._statsAllowedIps = []
+    def _loadSignalingSecrets(self):
+        self._signalingSecretsBySignalingUrl = {}
+        self._defaultSignalingSecret = self._sections.get('signaling', {}).get('internalsecret')
+
+        for signalingUrl, signalingId in self._signalingIdsBySignalingUrl.items():
+            secret = self._sections[signalingId]['internalsecret']
+            if not secret:
+                secret = self._defaultSignalingSecret
+
+            self._signalingSecretsBySignalingUrl[signalingUrl] = secret
 
-        if 'stats' not in self._configParser or 'allowed_ips' not in self._configParser['stats']:
-            self._statsAllowedIps.append(ip_network('127.0.0.1'))
+    def _loadStatsAllowedIps(self):
+        if 'allowed_ips' not in self._sections.get('stats', {}):
+            self._statsAllowedIps = (_getDefaultStatsAllowedIp(),)
 
             return
 
-        allowedIps = self._configParser.get('stats', 'allowed_ips')
-        allowedIps = [allowedIp.strip() for allowedIp in allowedIps.split(',')]
+        allowedIps = self._sections['stats']['allowed_ips']
+        allowedIps = _splitList(allowedIps)
 
+        validAllowedIps = []
         for allowedIp in allowedIps:
+            if not _looksLikeIpOrCidr(allowedIp):
+                _logger.error("Invalid allowed IP %r does not appear to be an IPv4 or IPv6 network", allowedIp)
+                continue
+
             try:
-                allowedIp = ip_network(allowedIp)
+                allowedIp = ip_network(_withoutScope(allowedIp))
 
-                self._statsAllowedIps.append(allowedIp)
+                validAllowedIps.append(allowedIp)
             except ValueError as valueError:
-                self._logger.error("Invalid allowed IP %s", valueError)
+                _logger.error("Invalid allowed IP %s", valueError)
+
+        self._statsAllowedIps = tuple(validAllowedIps)
+
+    def _loadFfmpeg(self):
+        ffmpeg = self._sections.get('ffmpeg', {})
+
+        self._ffmpegCommon = tuple(ffmpeg.get('common', 'ffmpeg -loglevel level+warning -n').split())
+        self._ffmpegOutputAudio = tuple(ffmpeg.get('outputaudio', '-c:a libopus').split())
+        self._ffmpegOutputVideo = tuple(ffmpeg.get('outputvideo', '-c:v libvpx -deadline:v realtime -crf 10 -b:v 1M').split())
+
+    def getGeneration(self):
+        """
+        Returns the number of times that the configuration was loaded.
+
+        It can be used to know whether values derived from the configuration
+        need to be computed again.
+        """
+        return self._generation
 
     def getLogLevel(self):
         """
@@ -170,7 +493,7 @@ class Config:
 
         Defaults to INFO (20).
         """
-        return int(self._configParser.get('logs', 'level', fallback=logging.INFO))
+        return int(self._sections.get('logs', {}).get('level', logging.INFO))
 
     def getListen(self):
         """
@@ -178,16 +501,35 @@ class Config:
 
         Defaults to "127.0.0.1:8000".
         """
-        return self._configParser.get('http', 'listen', fallback='127.0.0.1:8000')
+        return self._sections.get('http', {}).get('listen', '127.0.0.1:8000')
+
+    def getUseGunicorn(self):
+        """
+        Returns whether to run the server with gunicorn rather than with the
+        development server of Flask.
+
+        Defaults to False.
+        """
+        return self._sections.get('http', {}).get('gunicorn') == 'true'
+
+    def getThreads(self):
+        """
+        Returns the number of threads to handle HTTP requests with.
+
+        Only used when the server is run with gunicorn.
+
+        Defaults to 8.
+        """
+        return int(self._sections.get('http', {}).get('threads', 8))
 
     def getTrustedProxies(self):
         """
         Returns the list of trusted proxies.
 
         All proxies are returned as an IPv4Network or IPv6Network, even if they
-        are a single IP address.
+        are a single IP address. The list is returned as a tuple.
 
-        Defaults to an empty list.
+        Defaults to an empty tuple.
         """
         return self._trustedProxies
 
@@ -197,16 +539,16 @@ class Config:
 
         Defaults to None.
         """
-        if self._configParser.get('backend', 'allowall', fallback=None) == 'true':
-            return self._configParser.get('backend', 'secret')
-
-        backendUrl = backendUrl.rstrip('/')
-        if backendUrl in self._backendIdsByBackendUrl:
-            backendId = self._backendIdsByBackendUrl[backendUrl]
+        return self.getBackendConfig(backendUrl).secret
 
-            return self._configParser.get(backendId, 'secret', fallback=None)
+    def getBackendSecretBytes(self, backendUrl):
+        """
+        Returns the shared secret for requests from and to the backend servers
+        encoded as UTF-8.
 
-        return None
+        Defaults to None.
+        """
+        return self.getBackendConfig(backendUrl).secretBytes
 
     def getBackendSkipVerify(self, backendUrl):
         """
@@ -215,7 +557,7 @@ class Config:
 
         Defaults to False.
         """
-        return self._getBackendValue(backendUrl, 'skipverify', False) == 'true'
+        return self.getBackendConfig(backendUrl).skipVerify
 
     def getBackendMaximumMessageSize(self, backendUrl):
         """
@@ -224,7 +566,7 @@ class Config:
 
         Defaults to 1024.
         """
-        return int(self._getBackendValue(backendUrl, 'maxmessagesize', 1024))
+        return self.getBackendConfig(backendUrl).maximumMessageSize
 
     def getBackendVideoWidth(self, backendUrl):
         """
@@ -232,7 +574,7 @@ class Config:
 
         Defaults to 1920.
         """
-        return int(self._getBackendValue(backendUrl, 'videowidth', 1920))
+        return self.getBackendConfig(backendUrl).videoWidth
 
     def getBackendVideoHeight(self, backendUrl):
         """
@@ -240,7 +582,7 @@ class Config:
 
         Defaults to 1080.
         """
-        return int(self._getBackendValue(backendUrl, 'videoheight', 1080))
+        return self.getBackendConfig(backendUrl).videoHeight
 
     def getBackendDirectory(self, backendUrl):
         """
@@ -248,17 +590,21 @@ class Config:
 
         Defaults to False.
         """
-        return self._getBackendValue(backendUrl, 'directory', '/tmp')
+        return self.getBackendConfig(backendUrl).directory
 
-    def _getBackendValue(self, backendUrl, key, default):
-        backendUrl = backendUrl.rstrip('/')
-        if backendUrl in self._backendIdsByBackendUrl:
-            backendId = self._backendIdsByBackendUrl[backendUrl]
+    def getBackendConfig(self, backendUrl):
+        """
+        Returns all the configuration values of the given backend.
 
-            if self._configParser.get(backendId, key, fallback=None):
-                return self._configParser.get(backendId, key)
+        The values are the same ones returned by the specific getters, but
+        they are all got with a single lookup.
 
-        return self._configParser.get('backend', key, fallback=default)
+        :return: the BackendConfig for the backend.
+        """
+        return self._cachedBackendConfigLookup(self._generation, backendUrl)
+
+    def _lookupBackendConfig(self, generation, backendUrl): # pylint: disable=unused-argument
+        return self._getBackendConfigById(self._backendIdsByBackendUrl.get(_canonicalizeUrl(backendUrl)))
 
     def getSignalingSecret(self, signalingUrl):
         """
@@ -267,39 +613,41 @@ class Config:
 
         Defaults to None.
         """
-        signalingUrl = signalingUrl.rstrip('/')
-        if signalingUrl in self._signalingIdsBySignalingUrl:
-            signalingId = self._signalingIdsBySignalingUrl[signalingUrl]
-
-            if self._configParser.get(signalingId, 'internalsecret', fallback=None):
-                return self._configParser.get(signalingId, 'internalsecret')
+        return self._cachedSignalingSecretLookup(self._generation, signalingUrl)
 
-        return self._configParser.get('signaling', 'internalsecret', fallback=None)
+    def _lookupSignalingSecret(self, generation, signalingUrl): # pylint: disable=unused-argument
+        return self._signalingSecretsBySignalingUrl.get(_canonicalizeUrl(signalingUrl), self._defaultSignalingSecret)
 
     def getFfmpegCommon(self):
         """
         Returns the ffmpeg executable (name or full path) and the global options
         given to ffmpeg.
 
-        Defaults to ['ffmpeg', '-loglevel', 'level+warning', '-n'].
+        The options are returned as a tuple.
+
+        Defaults to ('ffmpeg', '-loglevel', 'level+warning', '-n').
         """
-        return self._configParser.get('ffmpeg', 'common', fallback='ffmpeg -loglevel level+warning -n').split()
+        return self._ffmpegCommon
 
     def getFfmpegOutputAudio(self):
         """
         Returns the options given to ffmpeg to encode the audio output.
 
-        Defaults to ['-c:a', 'libopus'].
+        The options are returned as a tuple.
+
+        Defaults to ('-c:a', 'libopus').
         """
-        return self._configParser.get('ffmpeg', 'outputaudio', fallback='-c:a libopus').split()
+        return self._ffmpegOutputAudio
 
     def getFfmpegOutputVideo(self):
         """
         Returns the options given to ffmpeg to encode the video output.
 
-        Defaults to ['-c:v', 'libvpx', '-deadline:v', 'realtime', '-crf', '10', '-b:v', '1M'].
+        The options are returned as a tuple.
+
+        Defaults to ('-c:v', 'libvpx', '-deadline:v', 'realtime', '-crf', '10', '-b:v', '1M').
         """
-        return self._configParser.get('ffmpeg', 'outputvideo', fallback='-c:v libvpx -deadline:v realtime -crf 10 -b:v 1M').split()
+        return self._ffmpegOutputVideo
 
     def getFfmpegExtensionAudio(self):
         """
@@ -307,7 +655,7 @@ class Config:
 
         Defaults to ".ogg".
         """
-        return self._configParser.get('ffmpeg', 'extensionaudio', fallback='.ogg')
+        return self._sections.get('ffmpeg', {}).get('extensionaudio', '.ogg')
 
     def getFfmpegExtensionVideo(self):
         """
@@ -315,7 +663,7 @@ class Config:
 
         Defaults to ".webm".
         """
-        return self._configParser.get('ffmpeg', 'extensionvideo', fallback='.webm')
+        return self._sections.get('ffmpeg', {}).get('extensionvideo', '.webm')
 
     def getBrowserForRecording(self):
         """
@@ -323,16 +671,24 @@ class Config:
 
         Defaults to "firefox".
         """
-        return self._configParser.get('recording', 'browser', fallback='firefox')
+        return self._sections.get('recording', {}).get('browser', 'firefox')
+
+    def getMaximumConcurrentRecordings(self):
+        """
+        Returns the maximum number of recordings that can run at the same time.
+
+        0 means no maximum. Defaults to 0.
+        """
+        return int(self._sections.get('recording', {}).get('maxconcurrentrecordings', 0))
 
     def getStatsAllowedIps(self):
         """
         Returns the list of IPs allowed to query the stats.
 
         All IPs are returned as an IPv4Network or IPv6Network, even if they are
-        a single IP address.
+        a single IP address. The list is returned as a tuple.
 
-        Defaults to ['127.0.0.1'].
+        Defaults to a tuple with only 127.0.0.1.
         """
         return self._statsAllowedIps
 
@@ -0,0 +1,103 @@
+#
+# @copyright Copyright (c) 2024, Nextcloud Talk Team
+#
+# @license GNU AGPL version 3 or any later version
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Module to quickly parse simple INI files.
+
+Only a subset of the syntax supported by ConfigParser is supported, which is
+enough for the typical configuration files:
+- "[section]" headers.
+- "key = value" (or "key: value") options; keys are case insensitive (they are
+  converted to lower case) and leading and trailing whitespaces are removed
+  from keys and values. Section names and keys are interned.
+- Full line comments starting with "#" or ";".
+- Empty lines.
+
+Multiline values, options without values, indented lines, interpolation (any
+value with "%"), the DEFAULT section and duplicated sections or options are not
+supported. A ValueError is raised if any of them is found, so the caller can
+fall back to ConfigParser.
+
+For any text without unsupported syntax the parsed values are the same as the
+ones got with ConfigParser.
+"""
+
+import re
+import sys
+
+_SECTION = re.compile(r'\[([^\]]+)\]')
+
+def _findDelimiter(line):
+    """
+    Returns the index of the first "=" or ":" in the line, or -1 if there is
+    none.
+    """
+    equalsIndex = line.find('=')
+    colonIndex = line.find(':')
+
+    if equalsIndex < 0 or 0 <= colonIndex < equalsIndex:
+        return colonIndex
+
+    return equalsIndex
+
+def parse(text):
+    """
+    Parses the given INI text.
+
+    :param text: the text to parse.
+    :return: a dict with the sections, each section being a dict with the
+             options.
+    :raises ValueError: if the text uses syntax not supported by this parser.
+    """
+    sections = {}
+    section = None
+
+    for lineNumber, line in enumerate(text.split('\n'), start=1):
+        strippedLine = line.strip()
+
+        if not strippedLine or strippedLine[0] in '#;':
+            continue
+
+        if line[0].isspace():
+            raise ValueError(f"Indented line {lineNumber}")
+
+        sectionMatch = _SECTION.fullmatch(strippedLine)
+        if sectionMatch:
+            sectionName = sectionMatch.group(1)
+            if sectionName == 'DEFAULT' or sectionName in sections:
+                raise ValueError(f"Unsupported section {sectionName} in line {lineNumber}")
+
+            section = {}
+            sections[sys.intern(sectionName)] = section
+
+            continue
+
+        delimiterIndex = _findDelimiter(strippedLine)
+        if delimiterIndex < 0 or section is None:
+            raise ValueError(f"Unsupported line {lineNumber}")
+
+        key = strippedLine[:delimiterIndex].rstrip().lower()
+        value = strippedLine[delimiterIndex + 1:].lstrip()
+
+        if not key or key in section or '%' in value:
+            raise ValueError(f"Unsupported option in line {lineNumber}")
+
+        section[sys.intern(key)] = value
+
+    return sections
@@ -21,9 +21,59 @@
 Module to get the arguments to start the recorder process.
 """
 
-from nextcloud.talk.recording import RECORDING_STATUS_AUDIO_AND_VIDEO
+from functools import lru_cache
+from itertools import chain
+
+from nextcloud.talk.recording import RECORDING_STATUS_AUDIO_AND_VIDEO, RECORDING_STATUS_AUDIO_ONLY
 from .Config import config
 
+_FFMPEG_INPUT_AUDIO = ('-f', 'pulse', '-i', None)
+
+@lru_cache(maxsize=32)
+def _getAudioArgumentsTemplate(ffmpegCommon, ffmpegOutputAudio):
+    """
+    Returns the recorder arguments that do not change between audio only
+    recordings with the same parameters.
+
+    The audio source is left empty; its index in the returned arguments is
+    returned too, so the actual value can be set in a copy of the arguments.
+    The output file name is not included.
+
+    :return: a tuple with the arguments (as a tuple) and the index of the audio
+             source.
+    """
+    # The arguments are built in a single pass rather than by concatenating
+    # the parts one by one.
+    arguments = tuple(chain(ffmpegCommon, _FFMPEG_INPUT_AUDIO, ffmpegOutputAudio))
+
+    audioSourceIndex = len(ffmpegCommon) + len(_FFMPEG_INPUT_AUDIO) - 1
+
+    return arguments, audioSourceIndex
+
+@lru_cache(maxsize=32)
+def _getAudioAndVideoArgumentsTemplate(width, height, ffmpegCommon, ffmpegOutputAudio, ffmpegOutputVideo):
+    """
+    Returns the recorder arguments that do not change between audio and video
+    recordings with the same parameters.
+
+    The audio source and the display are left empty; their indices in the
+    returned arguments are returned too, so the actual values can be set in a
+    copy of the arguments. The output file name is not included.
+
+    :return: a tuple with the arguments (as a tuple), the index of the audio
+             source and the index of the display.
+    """
+    ffmpegInputVideo = ('-f', 'x11grab', '-draw_mouse', '0', '-video_size', f'{width}x{height}', '-i', None)
+
+    # The arguments are built in a single pass rather than by concatenating
+    # the parts one by one.
+    arguments = tuple(chain(ffmpegCommon, _FFMPEG_INPUT_AUDIO, ffmpegInputVideo, ffmpegOutputAudio, ffmpegOutputVideo))
+
+    audioSourceIndex = len(ffmpegCommon) + len(_FFMPEG_INPUT_AUDIO) - 1
+    displayIndex = audioSourceIndex + len(ffmpegInputVideo)
+
+    return arguments, audioSourceIndex, displayIndex
+
 class RecorderArgumentsBuilder:
     """
     Helper class to get the arguments to start the recorder process.
@@ -41,6 +91,11 @@ class RecorderArgumentsBuilder:
         self._ffmpegOutputVideo = None
         self._extension = None
 
+        self._recorderArgumentsGetters = {
+            RECORDING_STATUS_AUDIO_AND_VIDEO: self._getAudioAndVideoRecorderArguments,
+            RECORDING_STATUS_AUDIO_ONLY: self._getAudioRecorderArguments,
+        }
+
     def getRecorderArguments(self, status, displayId, audioSourceIndex, width, height, extensionlessOutputFileName):
         """
         Returns the list of arguments to start the recorder process.
@@ -56,28 +111,59 @@ class RecorderArgumentsBuilder:
         :returns: the file name for the recording, with extension.
         """
 
-        ffmpegCommon = self.getFfmpegCommon()
-        ffmpegInputAudio = ['-f', 'pulse', '-i', audioSourceIndex]
-        ffmpegInputVideo = ['-f', 'x11grab', '-draw_mouse', '0', '-video_size', f'{width}x{height}', '-i', displayId]
-        ffmpegOutputAudio = self.getFfmpegOutputAudio()
-        ffmpegOutputVideo = self.getFfmpegOutputVideo()
+        outputFileName = extensionlessOutputFileName + self.getExtension(status)
 
-        extension = self.getExtension(status)
+        # As in previous versions, any status other than audio and video is an
+        # audio only recording. That includes unhashable values (like a list
+        # received in the request), which can not be looked up in the dict.
+        try:
+            getter = self._recorderArgumentsGetters.get(status, self._getAudioRecorderArguments)
+        except TypeError:
+            getter = self._getAudioRecorderArguments
 
-        outputFileName = extensionlessOutputFileName + extension
+        return getter(displayId, audioSourceIndex, width, height, outputFileName)
 
-        ffmpegArguments = ffmpegCommon
-        ffmpegArguments += ffmpegInputAudio
+    def _getAudioRecorderArguments(self, displayId, audioSourceIndex, width, height, outputFileName):
+        """
+        Returns the list of arguments to start the recorder process for an audio
+        only recording.
+        """
+        # pylint: disable=unused-argument
 
-        if status == RECORDING_STATUS_AUDIO_AND_VIDEO:
-            ffmpegArguments += ffmpegInputVideo
+        # The arguments shared by recordings with the same parameters are
+        # cached, so only the values specific to this recording need to be
+        # set. The options are always tuples, so they can be used as the keys
+        # of the cache.
+        template, audioSourceArgumentIndex = _getAudioArgumentsTemplate(
+            self.getFfmpegCommon(),
+            self.getFfmpegOutputAudio(),
+        )
 
-        ffmpegArguments += ffmpegOutputAudio
+        ffmpegArguments = list(template)
+        ffmpegArguments[audioSourceArgumentIndex] = audioSourceIndex
+        ffmpegArguments.append(outputFileName)
 
-        if status == RECORDING_STATUS_AUDIO_AND_VIDEO:
-            ffmpegArguments += ffmpegOutputVideo
+        return ffmpegArguments
+
+    def _getAudioAndVideoRecorderArguments(self, displayId, audioSourceIndex, width, height, outputFileName):
+        """
+        Returns the list of arguments to start the recorder process for an audio
+        and video recording.
+        """
+        template, audioSourceArgumentIndex, displayArgumentIndex = _getAudioAndVideoArgumentsTemplate(
+            width,
+            height,
+            self.getFfmpegCommon(),
+            self.getFfmpegOutputAudio(),
+            self.getFfmpegOutputVideo(),
+        )
+
+        ffmpegArguments = list(template)
+        ffmpegArguments[audioSourceArgumentIndex] = audioSourceIndex
+        ffmpegArguments[displayArgumentIndex] = displayId
+        ffmpegArguments.append(outputFileName)
 
-        return ffmpegArguments + [outputFileName]
+        return ffmpegArguments
 
     def getFfmpegCommon(self):
         """
@@ -127,20 +213,23 @@ class RecorderArgumentsBuilder:
         """
         Sets the ffmpeg executable (name or full path) and the global options
         given to ffmpeg.
+
+        Like the options got from the configuration, the options are stored as
+        a tuple, so they can be shared without copying them.
         """
-        self._ffmpegCommon = ffmpegCommon
+        self._ffmpegCommon = tuple(ffmpegCommon) if ffmpegCommon is not None else None
 
     def setFfmpegOutputAudio(self, ffmpegOutputAudio):
         """
         Sets the options given to ffmpeg to encode the audio output.
         """
-        self._ffmpegOutputAudio = ffmpegOutputAudio
+        self._ffmpegOutputAudio = tuple(ffmpegOutputAudio) if ffmpegOutputAudio is not None else None
 
     def setFfmpegOutputVideo(self, ffmpegOutputVideo):
         """
         Sets the options given to ffmpeg to encode the video output.
         """
-        self._ffmpegOutputVideo = ffmpegOutputVideo
+        self._ffmpegOutputVideo = tuple(ffmpegOutputVideo) if ffmpegOutputVideo is not None else None
 
     def setExtension(self, extension):
         """
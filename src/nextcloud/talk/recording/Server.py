@@ -26,15 +26,23 @@ import json
 import hashlib
 import hmac
 import logging
-import re
+import socket
+from bisect import bisect_right
+from contextlib import ExitStack
 from ipaddress import ip_address
+from queue import SimpleQueue
 from threading import Lock, Thread
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from prometheus_client import Counter, Gauge, make_wsgi_app
-from werkzeug.exceptions import BadRequest, Forbidden, NotFound
+from werkzeug.exceptions import BadRequest, Forbidden, NotFound, ServiceUnavailable
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from nextcloud.talk import recording
 from nextcloud.talk.recording import RECORDING_STATUS_AUDIO_AND_VIDEO
 from .Config import config
@@ -45,6 +53,11 @@ from .Service import Service
 metricsRecordingsCurrent = Gauge('recording_recordings_current', 'The current number of recordings', ['backend'])
 metricsRecordingsTotal = Counter('recording_recordings_total', 'The total number of recordings', ['backend'])
 
+_BODY_CHUNK_SIZE = 65536
+
+_CHECKSUM_LENGTH = 2 * hashlib.sha256().digest_size
+_CHECKSUM_CHARACTERS = frozenset('0123456789abcdef')
+
 def isAddressInNetworks(address, networks):
     """
     Returns whether the given IP address belongs to any of the given IP
@@ -60,23 +73,199 @@ def isAddressInNetworks(address, networks):
 
     return False
 
+def _tryParseAddress(address):
+    """
+    Returns the IP version and the integer value of the given IP address.
+
+    The address is parsed directly from its text representation, without
+    creating an IPv4Address or IPv6Address.
+
+    The scope of IPv6 addresses, if any, is ignored, like it is ignored in the
+    networks of the configuration.
+
+    :param address: the IP address as a string.
+    :return: a tuple with the IP version and the address as an integer, or None
+             if the address is not a valid IP address.
+    """
+    try:
+        if ':' in address:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, address.partition('%')[0]), 'big')
+
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, address), 'big')
+    except (OSError, ValueError):
+        # inet_pton raises ValueError rather than OSError if the address
+        # contains an embedded null character.
+        return None
+
+def _parseAddress(address):
+    """
+    Returns the IP version and the integer value of the given IP address.
+
+    Like _tryParseAddress, but raising an error for invalid addresses.
+
+    :param address: the IP address as a string.
+    :return: a tuple with the IP version and the address as an integer.
+    :raises ValueError: if the address is not a valid IP address.
+    """
+    parsedAddress = _tryParseAddress(address)
+    if parsedAddress is None:
+        raise ValueError(f"{address!r} does not appear to be an IPv4 or IPv6 address")
+
+    return parsedAddress
+
+def _normalizeAddress(address, version):
+    """
+    Returns the normalized (compressed) representation of the given valid IP
+    address.
+
+    inet_pton only accepts IPv4 addresses in their canonical dotted decimal
+    form, so an IPv4 address that was parsed by _tryParseAddress is already
+    normalized and it is returned as is. IPv6 addresses are converted to an
+    IPv6Address to get their compressed representation; the scope, if any, is
+    kept as is.
+
+    :param address: the IP address as a string, already parsed.
+    :param version: the IP version of the address.
+    :return: the normalized IP address.
+    """
+    if version == 4:
+        return address
+
+    address, separator, scope = address.partition('%')
+
+    return ip_address(address).compressed + separator + scope
+
+class _AddressRanges:
+    """
+    Set of IP networks to check whether an IP address belongs to any of them.
+
+    The networks are converted to ranges of integers, which are merged and
+    sorted for each IP version. Due to that checking an address is just a
+    binary search rather than comparing the address with every network.
+
+    The starts and the ends of the ranges are kept in separate (parallel)
+    lists, so the binary search compares plain integers rather than tuples.
+    """
+
+    def __init__(self, networks):
+        rangesByVersion = {4: [], 6: []}
+        for network in networks:
+            rangesByVersion[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self._startsByVersion = {}
+        self._endsByVersion = {}
+        for version, ranges in rangesByVersion.items():
+            starts = []
+            ends = []
+            for start, end in sorted(ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+
+            self._startsByVersion[version] = starts
+            self._endsByVersion[version] = ends
+
+    def __bool__(self):
+        return any(self._startsByVersion.values())
+
+    def __contains__(self, address):
+        """
+        Returns whether the given IPv4Address or IPv6Address belongs to any of
+        the networks.
+        """
+        return self.containsAddressInt(address.version, int(address))
+
+    def containsAddressInt(self, version, addressInt):
+        """
+        Returns whether the given IP address, as an integer of the given IP
+        version, belongs to any of the networks.
+        """
+        # The range to check is the last one starting at or before the address.
+        index = bisect_right(self._startsByVersion[version], addressInt) - 1
+
+        return index >= 0 and addressInt <= self._endsByVersion[version][index]
+
+class _DaemonThreadPool:
+    """
+    Pool of daemon threads to run tasks in the background.
+
+    Threads are started as needed and then reused for later tasks. There is no
+    maximum number of threads, so a submitted task never waits for a busy
+    thread to be free.
+
+    ThreadPoolExecutor is not used, as the interpreter waits for its threads to
+    finish before exiting, and starting a recording does not finish until the
+    recording is stopped.
+    """
+
+    def __init__(self, threadNamePrefix):
+        """
+        :param threadNamePrefix: the prefix for the names of the threads.
+        """
+        self._threadNamePrefix = threadNamePrefix
+        self._tasks = SimpleQueue()
+        self._lock = Lock()
+        self._threads = 0
+        # Number of threads waiting for a task.
+        self._idleThreads = 0
+
+    def submit(self, function, *args):
+        """
+        Runs the given function with the given arguments in a thread of the
+        pool.
+        """
+        with self._lock:
+            if self._idleThreads <= 0:
+                self._threads += 1
+
+                thread = Thread(target=self._run, name=f'{self._threadNamePrefix}-{self._threads}', daemon=True)
+                thread.start()
+            else:
+                self._idleThreads -= 1
+
+            self._tasks.put((function, args))
+
+    def _run(self):
+        while True:
+            function, args = self._tasks.get()
+
+            try:
+                function(*args)
+            except Exception: # pylint: disable=broad-exception-caught
+                logging.getLogger(__name__).exception("Task failed in %s", self._threadNamePrefix)
+
+            with self._lock:
+                self._idleThreads += 1
+
 class TrustedProxiesFix:
     """
     Middleware to adjust the remote address in the WSGI environment based on the
     configured trusted proxies.
     """
 
+    __slots__ = ('_app', '_config', '_trustedProxies', '_trustedProxiesGeneration')
+
     # pylint: disable=redefined-outer-name
     def __init__(self, app, config):
         self._app = app
         self._config = config
+        self._trustedProxies = None
+        self._trustedProxiesGeneration = None
 
     def __call__(self, environment, startResponse):
         """
         Modifies REMOTE_ADDR in the WSGI environment based on the
         "Forwarded-For" header before calling the wrapped application.
+
+        If there are no trusted proxies the wrapped application is directly
+        called, as the remote address would never be modified.
         """
 
+        if not self._getTrustedProxies():
+            return self._app(environment, startResponse)
+
         try:
             environment['REMOTE_ADDR'] = self.getRemoteAddress(environment)
         except ValueError as valueError:
@@ -104,46 +293,92 @@ class TrustedProxiesFix:
         all of them separated by commas and in the same order.
 
         ValueError is raised if REMOTE_ADDR is not included in the environment,
-        or if it is empty; none of that should happen, though.
+        or if it is empty; none of that should happen, though. ValueError is
+        also raised if REMOTE_ADDR is not a valid IP address, but only if it
+        needs to be checked against the trusted proxies.
 
         :return: the "real" remote address.
-        :raises ValueError: if there is no REMOTE_ADDR in the given environment.
+        :raises ValueError: if there is no valid REMOTE_ADDR in the given
+                            environment.
         """
 
-        if 'REMOTE_ADDR' not in environment:
+        originalRemoteAddress = environment.get('REMOTE_ADDR')
+        if originalRemoteAddress is None:
             raise ValueError('No REMOTE_ADDR in environment')
 
-        remoteAddress = environment['REMOTE_ADDR']
-        remoteAddress = self._getAddressWithoutPort(remoteAddress)
-        remoteAddress = ip_address(remoteAddress)
+        if not originalRemoteAddress:
+            raise ValueError('Empty REMOTE_ADDR in environment')
 
-        if 'HTTP_X_FORWARDED_FOR' not in environment:
-            return environment['REMOTE_ADDR']
+        # The remote address is parsed only if it could be a trusted proxy, as
+        # otherwise it is returned as is.
+        forwardedFor = environment.get('HTTP_X_FORWARDED_FOR')
+        if forwardedFor is None:
+            return originalRemoteAddress
 
-        trustedProxies = self._config.getTrustedProxies()
+        trustedProxies = self._getTrustedProxies()
 
-        if not isAddressInNetworks(remoteAddress, trustedProxies):
-            return environment['REMOTE_ADDR']
+        if not trustedProxies:
+            return originalRemoteAddress
 
-        forwardedFor = environment['HTTP_X_FORWARDED_FOR']
-        forwardedFor = [forwarded.strip() for forwarded in forwardedFor.split(',')]
-        forwardedFor.reverse()
+        # The addresses are checked as integers, and only the returned address
+        # is normalized.
+        remoteAddress = self._getAddressWithoutPort(originalRemoteAddress)
+        version, remoteAddressInt = _parseAddress(remoteAddress)
 
-        candidateAddress = remoteAddress.compressed
+        if not trustedProxies.containsAddressInt(version, remoteAddressInt):
+            return originalRemoteAddress
 
-        for forwarded in forwardedFor:
-            forwarded = self._getAddressWithoutPort(forwarded)
-            try:
-                forwarded = ip_address(forwarded)
-            except ValueError:
-                return candidateAddress
+        candidateAddress = remoteAddress
+        candidateVersion = version
+
+        # The functions called for every entry are bound to local names, as
+        # those are faster to look up than attributes and globals.
+        getAddressWithoutPort = self._getAddressWithoutPort
+        tryParseAddress = _tryParseAddress
+        containsAddressInt = trustedProxies.containsAddressInt
 
-            if not isAddressInNetworks(forwarded, trustedProxies):
-                return forwarded.compressed
+        # Entries are found, stripped and parsed from right to left only until
+        # the "real" remote address is found, so the rest of the header (which
+        # could be long and is not trustworthy anyway) is not even split.
+        entryEnd = len(forwardedFor)
+        while entryEnd >= 0:
+            entryStart = forwardedFor.rfind(',', 0, entryEnd) + 1
 
-            candidateAddress = forwarded.compressed
+            forwarded = getAddressWithoutPort(forwardedFor[entryStart:entryEnd].strip())
 
-        return candidateAddress
+            # Invalid entries are common (for example, empty entries), so they
+            # are detected without raising an error.
+            parsedForwarded = tryParseAddress(forwarded)
+            if parsedForwarded is None:
+                return _normalizeAddress(candidateAddress, candidateVersion)
+
+            version, forwardedInt = parsedForwarded
+            if not containsAddressInt(version, forwardedInt):
+                return _normalizeAddress(forwarded, version)
+
+            candidateAddress = forwarded
+            candidateVersion = version
+            entryEnd = entryStart - 1
+
+        return _normalizeAddress(candidateAddress, candidateVersion)
+
+    def _getTrustedProxies(self):
+        """
+        Returns the trusted proxies from the configuration.
+
+        The trusted proxies are got from the configuration the first time that
+        they are needed (which happens after the middleware was created, but
+        before any request is handled), and then again only if the
+        configuration was loaded again since then.
+
+        :return: an _AddressRanges with the trusted proxies.
+        """
+        generation = self._config.getGeneration()
+        if generation != self._trustedProxiesGeneration:
+            self._trustedProxies = _AddressRanges(self._config.getTrustedProxies())
+            self._trustedProxiesGeneration = generation
+
+        return self._trustedProxies
 
     def _getAddressWithoutPort(self, address):
         """
@@ -159,15 +394,16 @@ class TrustedProxiesFix:
         :return: the address without port.
         """
         colons = address.count(':')
-        if colons > 1:
-            # IPv6, might or might not have brackets and/or port, but we are
-            # only interested in the content between brackets, if any.
-            addressInBracketsMatch = re.match('\\[(.*)\\]', address)
-            if addressInBracketsMatch and len(addressInBracketsMatch.groups()) == 1:
-                return addressInBracketsMatch.group(1)
-        elif colons == 1:
+        if colons == 1:
             # IPv4 with trailing ":port"
-            return address[:address.find(':')]
+            return address.partition(':')[0]
+
+        if colons > 1 and address[:1] == '[':
+            # IPv6 with brackets and maybe port, but we are only interested in
+            # the content between the first bracket and the last one.
+            closingBracketIndex = address.rfind(']')
+            if closingBracketIndex > 0:
+                return address[1:closingBracketIndex]
 
         return address
 
@@ -177,10 +413,14 @@ class ProtectedMetrics:
     access them.
     """
 
+    __slots__ = ('config', 'metrics', '_allowedIps', '_allowedIpsGeneration')
+
     # pylint: disable=redefined-outer-name
     def __init__(self, config):
         self.config = config
         self.metrics = make_wsgi_app()
+        self._allowedIps = None
+        self._allowedIpsGeneration = None
 
     def __call__(self, environment, startResponse):
         """
@@ -188,33 +428,72 @@ class ProtectedMetrics:
         an error 403 if not.
         """
 
-        remoteAddress = environment['REMOTE_ADDR']
-        remoteAddress = ip_address(remoteAddress)
+        version, remoteAddress = _parseAddress(environment['REMOTE_ADDR'])
 
-        if not isAddressInNetworks(remoteAddress, config.getStatsAllowedIps()):
+        if not self._getAllowedIps().containsAddressInt(version, remoteAddress):
             startResponse('403 FORBIDDEN', [])
 
             return []
 
         return self.metrics(environment, startResponse)
 
+    def _getAllowedIps(self):
+        """
+        Returns the IPs allowed to access the metrics.
+
+        Like the trusted proxies, the allowed IPs are got from the configuration
+        the first time that they are needed, and then again only if the
+        configuration was loaded again.
+
+        :return: an _AddressRanges with the allowed IPs.
+        """
+        generation = self.config.getGeneration()
+        if generation != self._allowedIpsGeneration:
+            self._allowedIps = _AddressRanges(self.config.getStatsAllowedIps())
+            self._allowedIpsGeneration = generation
+
+        return self._allowedIps
+
 app = Flask(__name__)
-app.wsgi_app = TrustedProxiesFix(app.wsgi_app, config)
 
-app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
-    '/metrics': TrustedProxiesFix(ProtectedMetrics(config), config)
-})
+# The remote address is adjusted once for all the requests, before they are
+# dispatched to the Flask app or to the metrics.
+app.wsgi_app = TrustedProxiesFix(DispatcherMiddleware(app.wsgi_app, {
+    '/metrics': ProtectedMetrics(config)
+}), config)
 
 services = {}
 servicesStopping = {}
-servicesLock = Lock()
+
+# The services are guarded by several locks, each one for a subset of the
+# service ids, so requests for unrelated recordings do not wait for each other.
+servicesLocks = tuple(Lock() for _ in range(32))
+
+# Guards checking the number of services against the maximum and adding a new
+# one, which involves services guarded by different locks.
+servicesCountLock = Lock()
+
+# Starting and stopping use different pools, as starting does not finish until
+# the recording is stopped. The pools have no maximum, so starting and stopping
+# never wait for other recordings; they just reuse the threads that are idle.
+servicesStartThreadPool = _DaemonThreadPool('recording-start')
+servicesStopThreadPool = _DaemonThreadPool('recording-stop')
+
+def _getServicesLock(serviceId):
+    """
+    Returns the lock that guards the services with the given id.
+
+    :param serviceId: the id of the service, a tuple with its backend and token.
+    :return: the Lock for the service.
+    """
+    return servicesLocks[hash(serviceId) % len(servicesLocks)]
 
 @app.route("/api/v1/welcome", methods=["GET"])
 def welcome():
     """
     Handles welcome requests.
     """
-    return jsonify(version=recording.__version__)
+    return _jsonResponse(version=recording.__version__)
 
 @app.route("/api/v1/room/<token>", methods=["POST"])
 def handleBackendRequest(token):
@@ -242,51 +521,109 @@ def _validateRequest():
              the body.
     """
 
-    if 'Talk-Recording-Backend' not in request.headers:
+    headers = request.headers
+
+    backend = headers.get('Talk-Recording-Backend')
+    if backend is None:
         app.logger.warning("Missing Talk-Recording-Backend header")
         raise Forbidden()
 
-    backend = request.headers['Talk-Recording-Backend']
+    # All the values of the backend are got with a single lookup.
+    backendConfig = config.getBackendConfig(backend)
 
-    secret = config.getBackendSecret(backend)
+    secret = backendConfig.secretBytes
     if not secret:
         app.logger.warning("No secret configured for backend %s", backend)
         raise Forbidden()
 
-    if 'Talk-Recording-Random' not in request.headers:
+    random = headers.get('Talk-Recording-Random')
+    if random is None:
         app.logger.warning("Missing Talk-Recording-Random header")
         raise Forbidden()
 
-    random = request.headers['Talk-Recording-Random']
-
-    if 'Talk-Recording-Checksum' not in request.headers:
+    checksum = headers.get('Talk-Recording-Checksum')
+    if checksum is None:
         app.logger.warning("Missing Talk-Recording-Checksum header")
         raise Forbidden()
 
-    checksum = request.headers['Talk-Recording-Checksum']
+    # Only the exact representation sent by the backends is accepted, as
+    # bytes.fromhex() would also accept uppercase characters and whitespace.
+    if len(checksum) != _CHECKSUM_LENGTH or not _CHECKSUM_CHARACTERS.issuperset(checksum):
+        app.logger.warning("Invalid Talk-Recording-Checksum header: %s", checksum)
+        raise Forbidden()
 
-    maximumMessageSize = config.getBackendMaximumMessageSize(backend)
+    checksumBytes = bytes.fromhex(checksum)
 
-    if not request.content_length or request.content_length > maximumMessageSize:
-        app.logger.warning("Message size above limit: %d %d", request.content_length, maximumMessageSize)
-        raise BadRequest()
+    maximumMessageSize = backendConfig.maximumMessageSize
 
-    body = request.get_data()
+    contentLength = request.content_length
 
-    expectedChecksum = _calculateChecksum(secret, random, body)
-    if not hmac.compare_digest(checksum, expectedChecksum):
-        app.logger.warning("Checksum verification failed: %s %s", checksum, expectedChecksum)
+    if not contentLength or contentLength > maximumMessageSize:
+        app.logger.warning("Message size above limit: %d %d", contentLength, maximumMessageSize)
+        raise BadRequest()
+
+    bodyChunks, expectedChecksum = _readBodyAndCalculateChecksum(secret, random, request.stream, contentLength)
+    if not hmac.compare_digest(checksumBytes, expectedChecksum):
+        app.logger.warning("Checksum verification failed: %s %s", checksum, expectedChecksum.hex())
         raise Forbidden()
 
-    return backend, json.loads(body)
+    return backend, _loadJson(b''.join(bodyChunks))
+
+def _loadJson(data):
+    """
+    Returns the object representation of the given JSON data.
+
+    orjson is used if available, as it is much faster than the json module.
+
+    :param data: the JSON data, as bytes.
+    :return: the object representation of the data.
+    :raises ValueError: if the data is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data) # pylint: disable=no-member
+
+    return json.loads(data)
+
+def _jsonResponse(**kwargs):
+    """
+    Returns a response with the given arguments serialized as a JSON object.
+
+    Like when loading JSON, orjson is used if available.
+    """
+    if orjson is not None:
+        return Response(orjson.dumps(kwargs), mimetype='application/json') # pylint: disable=no-member
+
+    return jsonify(**kwargs)
+
+def _readBodyAndCalculateChecksum(secret, random, stream, contentLength):
+    """
+    Reads the body from the given stream while calculating its checksum.
+
+    The body is hashed as it is read in chunks, so the chunks only need to be
+    joined if the checksum is valid.
+
+    :param secret: the secret of the backend, as bytes.
+    :param random: the random sent in the request.
+    :param stream: the stream to read the body from.
+    :param contentLength: the length of the body.
+    :return: a tuple with the list of chunks of the body and the checksum.
+    """
+    # The random and the body are hashed separately to avoid copying the body
+    # to concatenate them.
+    hmacValue = hmac.new(secret, random.encode(), hashlib.sha256)
 
-def _calculateChecksum(secret, random, body):
-    secret = secret.encode()
-    message = random.encode() + body
+    bodyChunks = []
+    remaining = contentLength
+    while remaining > 0:
+        chunk = stream.read(min(_BODY_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
 
-    hmacValue = hmac.new(secret, message, hashlib.sha256)
+        hmacValue.update(chunk)
+        bodyChunks.append(chunk)
+        remaining -= len(chunk)
 
-    return hmacValue.hexdigest()
+    return bodyChunks, hmacValue.digest()
 
 def startRecording(backend, token, data):
     """
@@ -318,7 +655,7 @@ def startRecording(backend, token, data):
     :param token: the token of the room to start the recording in.
     :param data: the data used to start the recording.
     """
-    serviceId = f'{backend}-{token}'
+    serviceId = (backend, token)
 
     if 'start' not in data:
         raise BadRequest()
@@ -344,20 +681,34 @@ def startRecording(backend, token, data):
     actorType = data['start']['actor']['type']
     actorId = data['start']['actor']['id']
 
+    maximumConcurrentRecordings = config.getMaximumConcurrentRecordings()
+
     service = None
-    with servicesLock:
+    with ExitStack() as stack:
+        if maximumConcurrentRecordings:
+            stack.enter_context(servicesCountLock)
+
+        stack.enter_context(_getServicesLock(serviceId))
+
         if serviceId in services:
             app.logger.warning("Trying to start recording again: %s %s", backend, token)
             return {}
 
+        # Starting is rejected instead of queued, as the backend would consider
+        # the recording started.
+        if maximumConcurrentRecordings and len(services) >= maximumConcurrentRecordings:
+            app.logger.warning("Maximum number of concurrent recordings reached: %s %s", backend, token)
+            raise ServiceUnavailable()
+
         service = Service(backend, token, status, owner)
 
         services[serviceId] = service
 
+        metricsRecordingsCurrent.labels(service.backend).inc()
+
     app.logger.info("Start recording: %s %s", backend, token)
 
-    serviceStartThread = Thread(target=_startRecordingService, args=[service, actorType, actorId], daemon=True)
-    serviceStartThread.start()
+    servicesStartThreadPool.submit(_startRecordingService, service, actorType, actorId)
 
     return {}
 
@@ -368,17 +719,25 @@ def _startRecordingService(service, actorType, actorId):
     The recording service will be removed from the list of services if it can
     not be started.
 
+    The recording service is not started if it was stopped before the thread
+    started it.
+
     :param service: the Service to start.
     """
-    serviceId = f'{service.backend}-{service.token}'
+    serviceId = (service.backend, service.token)
+
+    with _getServicesLock(serviceId):
+        if services.get(serviceId) is not service:
+            app.logger.info("Recording stopped before starting: %s %s", service.backend, service.token)
+
+            return
 
-    metricsRecordingsCurrent.labels(service.backend).inc()
     metricsRecordingsTotal.labels(service.backend).inc()
 
     try:
         service.start(actorType, actorId)
     except Exception as exception:
-        with servicesLock:
+        with _getServicesLock(serviceId):
             if serviceId not in services:
                 # Service was already stopped, exception should have been caused
                 # by stopping the helpers even before the recorder started.
@@ -416,7 +775,7 @@ def stopRecording(backend, token, data):
     :param token: the token of the room to stop the recording in.
     :param data: the data used to stop the recording.
     """
-    serviceId = f'{backend}-{token}'
+    serviceId = (backend, token)
 
     if 'stop' not in data:
         raise BadRequest()
@@ -428,7 +787,7 @@ def stopRecording(backend, token, data):
         actorId = data['stop']['actor']['id']
 
     service = None
-    with servicesLock:
+    with _getServicesLock(serviceId):
         if serviceId not in services and serviceId in servicesStopping:
             app.logger.info("Trying to stop recording again: %s %s", backend, token)
             return {}
@@ -445,8 +804,7 @@ def stopRecording(backend, token, data):
 
     app.logger.info("Stop recording: %s %s", backend, token)
 
-    serviceStopThread = Thread(target=_stopRecordingService, args=[service, actorType, actorId], daemon=True)
-    serviceStopThread.start()
+    servicesStopThreadPool.submit(_stopRecordingService, service, actorType, actorId)
 
     return {}
 
@@ -459,14 +817,14 @@ def _stopRecordingService(service, actorType, actorId):
 
     :param service: the Service to stop.
     """
-    serviceId = f'{service.backend}-{service.token}'
+    serviceId = (service.backend, service.token)
 
     try:
         service.stop(actorType, actorId)
     except Exception:
         app.logger.exception("Failed to stop recording: %s %s", service.backend, service.token)
     finally:
-        with servicesLock:
+        with _getServicesLock(serviceId):
             if serviceId not in servicesStopping:
                 # This should never happen.
                 app.logger.error("Recording stopped when not in the list of stopping services: %s %s", service.backend, service.token)
@@ -479,11 +837,16 @@ def _stopRecordingService(service, actorType, actorId):
 # been killed already when it is executed, which unfortunately prevents a proper
 # cleanup of the temporary files opened by the browser.
 def _stopServicesOnExit():
-    with servicesLock:
-        serviceIds = list(services.keys())
-        for serviceId in serviceIds:
-            service = services.pop(serviceId)
-            del service
+    with ExitStack() as stack:
+        for servicesLock in servicesLocks:
+            stack.enter_context(servicesLock)
+
+        servicesToDelete = list(services.values())
+        services.clear()
+
+    # The services are deleted once the locks are released, as deleting them
+    # stops their helpers, which could take some time.
+    del servicesToDelete
 
 # Services should be explicitly deleted before exiting, as if they are
 # implicitly deleted while exiting the Selenium driver may not cleanly quit.
@@ -167,10 +167,12 @@ class Service:
                could not be started).
         """
 
-        width = config.getBackendVideoWidth(self.backend)
-        height = config.getBackendVideoHeight(self.backend)
+        backendConfig = config.getBackendConfig(self.backend)
 
-        directory = config.getBackendDirectory(self.backend).rstrip('/')
+        width = backendConfig.videoWidth
+        height = backendConfig.videoHeight
+
+        directory = backendConfig.directory.rstrip('/')
 
         sanitizedBackend = ''.join([character for character in self.backend if character.isalnum()])
 
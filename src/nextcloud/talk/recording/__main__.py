@@ -28,10 +28,44 @@ Module to provide the command line interface for the recorder.
 import argparse
 import logging
 
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
 from nextcloud.talk import recording
 from .Config import config
 from .Server import app
 
+def _runWithGunicorn(host, port, threads):
+    """
+    Runs the server app with gunicorn.
+
+    A single worker is used, as the recordings are tracked in the memory of
+    the process, so requests to stop a recording need to be handled by the
+    same process that started it.
+
+    :param host: the host to listen on.
+    :param port: the port to listen on.
+    :param threads: the number of threads of the worker.
+    """
+
+    class GunicornApplication(BaseApplication): # pylint: disable=abstract-method
+        """
+        gunicorn application to serve the already created server app.
+        """
+
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', threads)
+
+        def load(self):
+            return app
+
+    GunicornApplication().run()
+
 def main():
     """
     Runs the recorder with the arguments given in the command line.
@@ -39,6 +73,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config", help="path to configuration file", default="server.conf")
     parser.add_argument("-v", "--version", help="show version and quit", action="store_true")
+    parser.add_argument("--dev", help="use the development server even if gunicorn is enabled in the configuration", action="store_true")
     args = parser.parse_args()
 
     if args.version:
@@ -54,6 +89,20 @@ def main():
     listen = config.getListen()
     host, port = listen.split(':')
 
+    logger = logging.getLogger(__name__)
+
+    if not args.dev and config.getUseGunicorn():
+        if BaseApplication is not None:
+            logger.info("Running the server with gunicorn")
+
+            _runWithGunicorn(host, port, config.getThreads())
+
+            return
+
+        logger.warning("gunicorn is enabled in the configuration but it is not installed")
+
+    logger.info("Running the server with the development server of Flask")
+
     app.run(host, port, threaded=True)
 
 if __name__ == '__main__':
@@ -19,76 +19,195 @@
 
 # pylint: disable=missing-docstring
 
+import os
+from functools import lru_cache
 from ipaddress import ip_network
 
 import pytest
 
-from nextcloud.talk.recording.Config import Config
+from nextcloud.talk.recording import Config as ConfigModule
+from nextcloud.talk.recording.Config import BackendConfig, Config
+
+@lru_cache(maxsize=None)
+def _configFor(text):
+    """
+    Returns a Config loaded from the given string.
+
+    The Config is shared by all the tests using the same string, so it must
+    not be modified.
+    """
+    config = Config()
+    config.loadFromString(text)
+
+    return config
+
+@pytest.mark.parametrize('value, expectedResult', [
+    ('127.0.0.1', True),
+    ('192.168.0.0/16', True),
+    ('192.168.0.0/255.255.0.0', True),
+    ('2001:db8::1234:0/112', True),
+    ('fe80::1%eth0', True),
+    # The prefix length is not checked
+    ('192.168.0.0/not-a-prefix', True),
+    ('', False),
+    ('not-an-ip', False),
+    ('192.168.0', False),
+    ('192.168.0.0.0/16', False),
+    ('2001:db8::1234::0/112', False),
+    ('10.0.0.1\x00', False),
+    ('2001:db8::1\x00/64', False),
+])
+def testLooksLikeIpOrCidr(value, expectedResult):
+    # pylint: disable=protected-access
+    assert ConfigModule._looksLikeIpOrCidr(value) is expectedResult
+
+class ConfigTest: # pylint: disable=too-many-public-methods
+
+    # pylint: disable=invalid-name
+    def testLoadWhenFileNotModified(self, tmp_path):
+        configFile = tmp_path / 'server.conf'
+        configFile.write_text("""
+[http]
+listen = 127.0.0.1:8001
+""")
 
-class ConfigTest:
+        config = Config()
+        config.load(str(configFile))
+
+        assert config.getListen() == '127.0.0.1:8001'
+
+        fileStat = configFile.stat()
+        configFile.write_text("""
+[http]
+listen = 127.0.0.1:8002
+""")
+        os.utime(configFile, ns=(fileStat.st_atime_ns, fileStat.st_mtime_ns))
+
+        config.load(str(configFile))
+
+        assert config.getListen() == '127.0.0.1:8001'
+
+        config.load(str(configFile), force=True)
+
+        assert config.getListen() == '127.0.0.1:8002'
+
+        config.loadFromString("""
+[http]
+listen = 127.0.0.1:8003
+""")
+
+        assert config.getListen() == '127.0.0.1:8003'
+
+        config.load(str(configFile))
+
+        assert config.getListen() == '127.0.0.1:8002'
+
+    @pytest.mark.parametrize('configString, expectedUseGunicorn', [
+        ('', False),
+        ('[http]\n', False),
+        ('[http]\ngunicorn = false\n', False),
+        ('[http]\ngunicorn = true\n', True),
+    ])
+    def testGetUseGunicorn(self, configString, expectedUseGunicorn):
+        assert _configFor(configString).getUseGunicorn() is expectedUseGunicorn
+
+    def testGetGeneration(self, tmp_path):
+        configFile = tmp_path / 'server.conf'
+        configFile.write_text("""
+[http]
+listen = 127.0.0.1:8001
+""")
 
-    @pytest.fixture
-    def configLoadedFromString(self, monkeypatch):
-        # pylint: disable=protected-access
         config = Config()
 
-        # pylint: disable=unused-argument
-        def mockRead(fileName):
-            # pylint: disable=no-member
-            config._configParser.read_string(config.configString)
+        assert config.getGeneration() == 0
 
-        monkeypatch.setattr(config._configParser, 'read', mockRead)
+        config.load(str(configFile))
 
-        return config
+        assert config.getGeneration() == 1
 
-    def testGetTrustedProxies(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+        # Not modified, so not loaded again.
+        config.load(str(configFile))
+
+        assert config.getGeneration() == 1
+
+        config.loadFromString("""
+[http]
+listen = 127.0.0.1:8002
+""")
+
+        assert config.getGeneration() == 2
+
+    def testLoadWithInterpolation(self):
+        # Interpolation is not supported by FastIni, so ConfigParser is used.
+        config = _configFor("""
+[http]
+host = 127.0.0.1
+listen = %(host)s:8001
+""")
+
+        assert config.getListen() == '127.0.0.1:8001'
+
+    def testGetTrustedProxies(self):
+        config = _configFor("""
 [app]
 trustedproxies = 127.0.0.1, 2001:db8::0, not-an-ip, 192.168.0.0/16, 2001:db8::1234:0/112
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
-        assert configLoadedFromString.getTrustedProxies() == [
+        assert config.getTrustedProxies() == (
             ip_network('127.0.0.1'),
             ip_network('2001:db8::0'),
             ip_network('192.168.0.0/16'),
-            ip_network('2001:db8::1234:0/112')
-        ]
+            ip_network('2001:db8::1234:0/112'),
+        )
+
+        # The networks are parsed only once, when the configuration is loaded.
+        assert config.getTrustedProxies() is config.getTrustedProxies()
+
+    def testGetTrustedProxiesWithNullCharacter(self):
+        config = _configFor("""
+[app]
+trustedproxies = 127.0.0.1, 10.0.0.1\x00
+""")
+
+        assert config.getTrustedProxies() == (
+            ip_network('127.0.0.1'),
+        )
+
+    def testGetTrustedProxiesWithScope(self):
+        config = _configFor("""
+[app]
+trustedproxies = fe80::1%%eth0, fe80::%%eth1/64
+""")
 
-    def testGetTrustedProxiesWhenCommented(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+        assert config.getTrustedProxies() == (
+            ip_network('fe80::1'),
+            ip_network('fe80::/64'),
+        )
+
+    def testGetTrustedProxiesWhenCommented(self):
+        config = _configFor("""
 [app]
 #trustedproxies =
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
-        assert configLoadedFromString.getTrustedProxies() == []
+        assert not config.getTrustedProxies()
 
-    def testGetTrustedProxiesWhenEmpty(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetTrustedProxiesWhenEmpty(self):
+        config = _configFor("""
 [app]
 trustedproxies =
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
-        assert configLoadedFromString.getTrustedProxies() == []
+        assert not config.getTrustedProxies()
 
-    def testGetBackendValuesWhenNotSet(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    @pytest.mark.parametrize('configString, expectedValuesByBackendUrl', [
+        pytest.param("""
 [backend]
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com'
-        assert configLoadedFromString.getBackendSecret(backendUrl) is None
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 1024
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 1920
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 1080
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp'
-
-    def testGetBackendValuesWhenSet(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com': (None, False, 1024, 1920, 1080, '/tmp'),
+        }, id='not-set'),
+        pytest.param("""
 [backend]
 backends = backend1
 skipverify = true
@@ -100,27 +219,11 @@ directory = /srv/recording
 [backend1]
 url = https://cloud.server.com
 secret = the-shared-secret
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) is None
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is True
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-        backendUrl = 'https://cloud.server.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is True
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-    def testGetBackendValuesWhenSetByBackend(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com/': (None, True, 512, 960, 540, '/srv/recording'),
+            'https://cloud.server.com/': ('the-shared-secret', True, 512, 960, 540, '/srv/recording'),
+        }, id='set'),
+        pytest.param("""
 [backend]
 backends = backend1
 skipverify = false
@@ -137,27 +240,11 @@ maxmessagesize = 512
 videowidth = 960
 videoheight = 540
 directory = /srv/recording
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) is None
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 256
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 480
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 270
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp/files'
-
-        backendUrl = 'https://cloud.server.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is True
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-    def testGetBackendValuesWhenAllowingAll(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com/': (None, False, 256, 480, 270, '/tmp/files'),
+            'https://cloud.server.com/': ('the-shared-secret', True, 512, 960, 540, '/srv/recording'),
+        }, id='set-by-backend'),
+        pytest.param("""
 [backend]
 allowall = true
 secret = the-shared-secret-common
@@ -171,27 +258,11 @@ maxmessagesize = 512
 videowidth = 960
 videoheight = 540
 directory = /srv/recording
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret-common'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 1024
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 1920
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 1080
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp'
-
-        backendUrl = 'https://cloud.server.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret-common'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is True
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-    def testGetBackendValuesWhenExplicitlyDisallowingAll(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com/': ('the-shared-secret-common', False, 1024, 1920, 1080, '/tmp'),
+            'https://cloud.server.com/': ('the-shared-secret-common', True, 512, 960, 540, '/srv/recording'),
+        }, id='allowing-all'),
+        pytest.param("""
 [backend]
 allowall = false
 secret = the-shared-secret-common
@@ -205,27 +276,11 @@ maxmessagesize = 512
 videowidth = 960
 videoheight = 540
 directory = /srv/recording
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) is None
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 1024
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 1920
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 1080
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp'
-
-        backendUrl = 'https://cloud.server.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is True
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-    def testGetBackendValuesWhenExplicitlyDisallowingAllWithoutCommonSecret(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com/': (None, False, 1024, 1920, 1080, '/tmp'),
+            'https://cloud.server.com/': ('the-shared-secret', True, 512, 960, 540, '/srv/recording'),
+        }, id='explicitly-disallowing-all'),
+        pytest.param("""
 [backend]
 allowall = false
 backends = backend1
@@ -238,27 +293,11 @@ maxmessagesize = 512
 videowidth = 960
 videoheight = 540
 directory = /srv/recording
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) is None
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 1024
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 1920
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 1080
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp'
-
-        backendUrl = 'https://cloud.server.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is True
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-    def testGetBackendValuesWhenSeveralBackends(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com/': (None, False, 1024, 1920, 1080, '/tmp'),
+            'https://cloud.server.com/': ('the-shared-secret', True, 512, 960, 540, '/srv/recording'),
+        }, id='explicitly-disallowing-all-without-common-secret'),
+        pytest.param("""
 [backend]
 backends = first-backend, second-backend
 maxmessagesize = 2048
@@ -274,78 +313,181 @@ videoheight = 540
 url = https://cloud.server2.com
 secret = the-shared-secret2
 directory = /srv/recording
-"""
-        configLoadedFromString.load('fake-file-name')
-
-        backendUrl = 'https://cloud.unknown.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) is None
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 2048
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 1920
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 1080
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp'
-
-        backendUrl = 'https://cloud.server1.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret1'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 512
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 960
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 540
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/tmp'
-
-        backendUrl = 'https://cloud.server2.com/'
-        assert configLoadedFromString.getBackendSecret(backendUrl) == 'the-shared-secret2'
-        assert configLoadedFromString.getBackendSkipVerify(backendUrl) is False
-        assert configLoadedFromString.getBackendMaximumMessageSize(backendUrl) == 2048
-        assert configLoadedFromString.getBackendVideoWidth(backendUrl) == 1920
-        assert configLoadedFromString.getBackendVideoHeight(backendUrl) == 1080
-        assert configLoadedFromString.getBackendDirectory(backendUrl) == '/srv/recording'
-
-    def testGetSignalingSecretWhenNotSet(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+""", {
+            'https://cloud.unknown.com/': (None, False, 2048, 1920, 1080, '/tmp'),
+            'https://cloud.server1.com/': ('the-shared-secret1', False, 512, 960, 540, '/tmp'),
+            'https://cloud.server2.com/': ('the-shared-secret2', False, 2048, 1920, 1080, '/srv/recording'),
+        }, id='several-backends'),
+    ])
+    def testGetBackendValues(self, configString, expectedValuesByBackendUrl):
+        config = _configFor(configString)
+
+        for backendUrl, expectedValues in expectedValuesByBackendUrl.items():
+            secret, skipVerify, maximumMessageSize, videoWidth, videoHeight, directory = expectedValues
+
+            assert config.getBackendSecret(backendUrl) == secret
+            assert config.getBackendSkipVerify(backendUrl) is skipVerify
+            assert config.getBackendMaximumMessageSize(backendUrl) == maximumMessageSize
+            assert config.getBackendVideoWidth(backendUrl) == videoWidth
+            assert config.getBackendVideoHeight(backendUrl) == videoHeight
+            assert config.getBackendDirectory(backendUrl) == directory
+
+    def testGetBackendConfig(self):
+        config = _configFor("""
+[backend]
+backends = backend1
+maxmessagesize = 256
+directory = /tmp/files
+
+[backend1]
+url = https://cloud.server.com
+secret = the-shared-secret
+skipverify = true
+videowidth = 960
+videoheight = 540
+""")
+
+        assert config.getBackendConfig('https://cloud.unknown.com/') == BackendConfig(
+            secret=None,
+            secretBytes=None,
+            skipVerify=False,
+            maximumMessageSize=256,
+            videoWidth=1920,
+            videoHeight=1080,
+            directory='/tmp/files',
+        )
+        assert config.getBackendConfig('https://cloud.server.com/') == BackendConfig(
+            secret='the-shared-secret',
+            secretBytes=b'the-shared-secret',
+            skipVerify=True,
+            maximumMessageSize=256,
+            videoWidth=960,
+            videoHeight=540,
+            directory='/tmp/files',
+        )
+
+    def testGetBackendValuesWhenLoadedAgain(self):
+        config = Config()
+
+        config.loadFromString("""
+[backend]
+backends = backend1
+
+[backend1]
+url = https://cloud.server.com
+secret = the-shared-secret
+videowidth = 960
+""")
+
+        backendUrl = 'https://cloud.server.com/'
+        assert config.getBackendSecret(backendUrl) == 'the-shared-secret'
+        assert config.getBackendVideoWidth(backendUrl) == 960
+
+        config.loadFromString("""
+[backend]
+backends = backend1
+
+[backend1]
+url = https://cloud.server.com
+secret = another-shared-secret
+videowidth = 480
+""")
+
+        assert config.getBackendSecret(backendUrl) == 'another-shared-secret'
+        assert config.getBackendVideoWidth(backendUrl) == 480
+
+    def testGetBackendValuesWithDifferentCaseOrPath(self):
+        config = _configFor("""
+[backend]
+backends = backend1
+
+[backend1]
+url = https://Cloud.Server.com/nextcloud/
+secret = the-shared-secret
+""")
+
+        assert config.getBackendSecret('https://cloud.server.com/nextcloud') == 'the-shared-secret'
+        assert config.getBackendSecret('HTTPS://CLOUD.SERVER.COM/nextcloud/') == 'the-shared-secret'
+        assert config.getBackendSecret('https://cloud.server.com/Nextcloud') is None
+        assert config.getBackendSecret('https://cloud.server.com/') is None
+        assert config.getBackendSecret('https://cloud.server.com/nextcloud/other') is None
+
+    def testGetBackendValuesWithMalformedUrl(self):
+        config = _configFor("""
+[backend]
+backends = backend1
+
+[backend1]
+url = http://[abc/
+secret = the-shared-secret
+""")
+
+        assert config.getBackendSecret('http://[abc') == 'the-shared-secret'
+        assert config.getBackendSecret('http://[abc/') == 'the-shared-secret'
+        assert config.getBackendSecret('http://[def') is None
+
+    def testGetBackendValuesResolvesOnlyTheLookedUpBackends(self):
+        config = _configFor("""
+[backend]
+backends = backend1, backend2
+
+[backend1]
+url = https://cloud.server1.com
+secret = the-shared-secret1
+
+[backend2]
+url = https://cloud.server2.com
+secret = the-shared-secret2
+maxmessagesize = invalid
+""")
+
+        assert config.getBackendMaximumMessageSize('https://cloud.server1.com') == 1024
+
+        with pytest.raises(ValueError):
+            config.getBackendMaximumMessageSize('https://cloud.server2.com')
+
+    def testGetSignalingSecretWhenNotSet(self):
+        config = _configFor("""
 [signaling]
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
         signalingUrl = 'https://signaling.unknown.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) is None
+        assert config.getSignalingSecret(signalingUrl) is None
 
-    def testGetSignalingSecretWhenSet(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetSignalingSecretWhenSet(self):
+        config = _configFor("""
 [signaling]
 internalsecret = the-internal-secret-common
 signalings = signaling1
 
 [signaling1]
 url = https://signaling.server.com
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
         signalingUrl = 'https://signaling.unknown.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) == 'the-internal-secret-common'
+        assert config.getSignalingSecret(signalingUrl) == 'the-internal-secret-common'
 
         signalingUrl = 'https://signaling.server.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) == 'the-internal-secret-common'
+        assert config.getSignalingSecret(signalingUrl) == 'the-internal-secret-common'
 
-    def testGetSignalingSecretWhenSetBySignaling(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetSignalingSecretWhenSetBySignaling(self):
+        config = _configFor("""
 [signaling]
 signalings = signaling1
 
 [signaling1]
 url = https://signaling.server.com
 internalsecret = the-internal-secret
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
         signalingUrl = 'https://signaling.unknown.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) is None
+        assert config.getSignalingSecret(signalingUrl) is None
 
         signalingUrl = 'https://signaling.server.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) == 'the-internal-secret'
+        assert config.getSignalingSecret(signalingUrl) == 'the-internal-secret'
 
-    def testGetSignalingSecretWhenSeveralSignalings(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetSignalingSecretWhenSeveralSignalings(self):
+        config = _configFor("""
 [signaling]
 internalsecret = the-internal-secret-common
 signalings = signaling1, signaling2
@@ -357,48 +499,58 @@ internalsecret = the-internal-secret1
 [signaling2]
 url = https://signaling.server2.com
 internalsecret = the-internal-secret2
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
         signalingUrl = 'https://signaling.unknown.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) == 'the-internal-secret-common'
+        assert config.getSignalingSecret(signalingUrl) == 'the-internal-secret-common'
 
         signalingUrl = 'https://signaling.server1.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) == 'the-internal-secret1'
+        assert config.getSignalingSecret(signalingUrl) == 'the-internal-secret1'
 
         signalingUrl = 'https://signaling.server2.com'
-        assert configLoadedFromString.getSignalingSecret(signalingUrl) == 'the-internal-secret2'
+        assert config.getSignalingSecret(signalingUrl) == 'the-internal-secret2'
 
-    def testGetStatsAllowedIps(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetStatsAllowedIps(self):
+        config = _configFor("""
 [stats]
 allowed_ips = 127.0.0.1, 2001:db8::0, not-an-ip, 192.168.0.0/16, 2001:db8::1234:0/112
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
-        assert configLoadedFromString.getStatsAllowedIps() == [
+        assert config.getStatsAllowedIps() == (
             ip_network('127.0.0.1'),
             ip_network('2001:db8::0'),
             ip_network('192.168.0.0/16'),
-            ip_network('2001:db8::1234:0/112')
-        ]
+            ip_network('2001:db8::1234:0/112'),
+        )
+
+        # The networks are parsed only once, when the configuration is loaded.
+        assert config.getStatsAllowedIps() is config.getStatsAllowedIps()
+
+    def testGetStatsAllowedIpsWithScope(self):
+        config = _configFor("""
+[stats]
+allowed_ips = fe80::1%%eth0, fe80::%%eth1/64
+""")
+
+        assert config.getStatsAllowedIps() == (
+            ip_network('fe80::1'),
+            ip_network('fe80::/64'),
+        )
 
-    def testGetStatsAllowedIpsWhenCommented(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetStatsAllowedIpsWhenCommented(self):
+        config = _configFor("""
 [stats]
 #allowed_ips =
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
-        assert configLoadedFromString.getStatsAllowedIps() == [
-            ip_network('127.0.0.1')
-        ]
+        assert config.getStatsAllowedIps() == (
+            ip_network('127.0.0.1'),
+        )
 
-    def testGetStatsAllowedIpsWhenEmpty(self, configLoadedFromString):
-        configLoadedFromString.configString = """
+    def testGetStatsAllowedIpsWhenEmpty(self):
+        config = _configFor("""
 [stats]
 allowed_ips =
-"""
-        configLoadedFromString.load('fake-file-name')
+""")
 
-        assert configLoadedFromString.getStatsAllowedIps() == []
+        assert not config.getStatsAllowedIps()
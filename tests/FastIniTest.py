@@ -0,0 +1,73 @@
+#
+# @copyright Copyright (c) 2024, Nextcloud Talk Team
+#
+# @license GNU AGPL version 3 or any later version
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# pylint: disable=missing-docstring
+
+import sys
+from configparser import ConfigParser
+
+import pytest
+
+from nextcloud.talk.recording import FastIni
+
+def parseWithConfigParser(text):
+    configParser = ConfigParser()
+    configParser.read_string(text)
+
+    return {section: dict(configParser.items(section)) for section in configParser.sections()}
+
+@pytest.mark.parametrize('text', [
+    '',
+    '\n\n',
+    '[app]',
+    '[app]\ntrustedproxies =',
+    '[app]\n#trustedproxies = 127.0.0.1\n;trustedproxies = 127.0.0.1',
+    '[app]\n    # Indented comment\ntrustedproxies = 127.0.0.1, 192.168.0.0/16   ',
+    '[http]\nlisten = 127.0.0.1:8000',
+    '[http]\nlisten: 127.0.0.1:8000',
+    '[http]\nlisten=127.0.0.1:8000\r\n\r\n[logs]\r\nlevel=10\r\n',
+    '[backend]\nBackends = backend1\n\n[backend1]\nurl = https://cloud.server.com\nsecret = the=shared:secret',
+    '[backend1]\nurl: https://cloud.server.com/?a=b\nsecret=the:shared=secret',
+])
+def testParse(text):
+    assert FastIni.parse(text) == parseWithConfigParser(text)
+
+@pytest.mark.parametrize('text', [
+    'listen = 127.0.0.1:8000',
+    '[DEFAULT]\nlevel = 10',
+    '[app]\n[app]',
+    '[app]\nkey = value\nkey = another value',
+    '[app]\nkey = value\n  continuation',
+    '[app]\nkey',
+    '[app]\n= value',
+    '[app]\nkey = %(other)s',
+    '[app] trailing',
+])
+def testParseUnsupportedSyntax(text):
+    with pytest.raises(ValueError):
+        FastIni.parse(text)
+
+def testParseInternsSectionsAndKeys():
+    sections = FastIni.parse('[http]\nLISTEN = 127.0.0.1:8000')
+
+    section = next(iter(sections))
+    key = next(iter(sections['http']))
+
+    assert section is sys.intern('http')
+    assert key is sys.intern('listen')
@@ -0,0 +1,108 @@
+#
+# @copyright Copyright (c) 2024, Nextcloud Talk Team
+#
+# @license GNU AGPL version 3 or any later version
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# pylint: disable=missing-docstring
+
+import pytest
+
+from nextcloud.talk.recording import RecorderArgumentsBuilder as RecorderArgumentsBuilderModule
+from nextcloud.talk.recording import RECORDING_STATUS_AUDIO_AND_VIDEO, RECORDING_STATUS_AUDIO_ONLY
+from nextcloud.talk.recording.Config import Config
+from nextcloud.talk.recording.RecorderArgumentsBuilder import RecorderArgumentsBuilder
+
+AUDIO_ONLY_ARGUMENTS = [
+    'ffmpeg', '-loglevel', 'level+warning', '-n',
+    '-f', 'pulse', '-i', '42',
+    '-c:a', 'libopus',
+    '/tmp/recording.ogg',
+]
+
+AUDIO_AND_VIDEO_ARGUMENTS = [
+    'ffmpeg', '-loglevel', 'level+warning', '-n',
+    '-f', 'pulse', '-i', '42',
+    '-f', 'x11grab', '-draw_mouse', '0', '-video_size', '1920x1080', '-i', ':108',
+    '-c:a', 'libopus',
+    '-c:v', 'libvpx', '-deadline:v', 'realtime', '-crf', '10', '-b:v', '1M',
+    '/tmp/recording.webm',
+]
+
+@pytest.fixture(autouse=True)
+def defaultConfig(monkeypatch):
+    # The recorder arguments are got from a configuration with just the default
+    # values rather than from the shared configuration.
+    config = Config()
+    config.loadFromString('')
+
+    monkeypatch.setattr(RecorderArgumentsBuilderModule, 'config', config)
+
+class RecorderArgumentsBuilderTest:
+
+    def testGetRecorderArgumentsForAudioOnly(self):
+        recorderArgumentsBuilder = RecorderArgumentsBuilder()
+
+        assert recorderArgumentsBuilder.getRecorderArguments(RECORDING_STATUS_AUDIO_ONLY, ':108', '42', 1920, 1080, '/tmp/recording') == AUDIO_ONLY_ARGUMENTS
+
+    def testGetRecorderArgumentsForAudioAndVideo(self):
+        recorderArgumentsBuilder = RecorderArgumentsBuilder()
+
+        assert recorderArgumentsBuilder.getRecorderArguments(RECORDING_STATUS_AUDIO_AND_VIDEO, ':108', '42', 1920, 1080, '/tmp/recording') == AUDIO_AND_VIDEO_ARGUMENTS
+
+    @pytest.mark.parametrize('status', [0, 3, None, 'unknown', [1], {'status': 1}])
+    def testGetRecorderArgumentsForUnknownStatus(self, status):
+        recorderArgumentsBuilder = RecorderArgumentsBuilder()
+
+        # Any status other than audio and video is an audio only recording.
+        assert recorderArgumentsBuilder.getRecorderArguments(status, ':108', '42', 1920, 1080, '/tmp/recording') == AUDIO_ONLY_ARGUMENTS
+
+    def testGetRecorderArgumentsWithCustomOptions(self):
+        recorderArgumentsBuilder = RecorderArgumentsBuilder()
+        recorderArgumentsBuilder.setFfmpegCommon(['/usr/bin/ffmpeg', '-y'])
+        recorderArgumentsBuilder.setFfmpegOutputAudio(['-c:a', 'aac'])
+        recorderArgumentsBuilder.setFfmpegOutputVideo(['-c:v', 'libx264', '-preset', 'ultrafast'])
+        recorderArgumentsBuilder.setExtension('.mp4')
+
+        assert recorderArgumentsBuilder.getRecorderArguments(RECORDING_STATUS_AUDIO_ONLY, ':108', '42', 1280, 720, '/tmp/recording') == [
+            '/usr/bin/ffmpeg', '-y',
+            '-f', 'pulse', '-i', '42',
+            '-c:a', 'aac',
+            '/tmp/recording.mp4',
+        ]
+
+        assert recorderArgumentsBuilder.getRecorderArguments(RECORDING_STATUS_AUDIO_AND_VIDEO, ':108', '42', 1280, 720, '/tmp/recording') == [
+            '/usr/bin/ffmpeg', '-y',
+            '-f', 'pulse', '-i', '42',
+            '-f', 'x11grab', '-draw_mouse', '0', '-video_size', '1280x720', '-i', ':108',
+            '-c:a', 'aac',
+            '-c:v', 'libx264', '-preset', 'ultrafast',
+            '/tmp/recording.mp4',
+        ]
+
+    def testGetRecorderArgumentsReturnsNewLists(self):
+        recorderArgumentsBuilder = RecorderArgumentsBuilder()
+
+        recorderArguments = recorderArgumentsBuilder.getRecorderArguments(RECORDING_STATUS_AUDIO_ONLY, ':108', '42', 1920, 1080, '/tmp/recording')
+        recorderArguments.append('modified')
+
+        # The cached arguments are not modified by the caller.
+        assert recorderArgumentsBuilder.getRecorderArguments(RECORDING_STATUS_AUDIO_ONLY, ':108', '43', 1920, 1080, '/tmp/other') == [
+            'ffmpeg', '-loglevel', 'level+warning', '-n',
+            '-f', 'pulse', '-i', '43',
+            '-c:a', 'libopus',
+            '/tmp/other.ogg',
+        ]
@@ -17,12 +17,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-# pylint: disable=missing-docstring
+# pylint: disable=missing-docstring,too-many-lines
 
+import hashlib
+import hmac
 import sys
+from io import BytesIO
+from threading import Barrier, Event, current_thread
+from time import sleep
 from ipaddress import ip_address, ip_network
 
 import pytest
+from werkzeug.exceptions import BadRequest, Forbidden, ServiceUnavailable
 
 # pulsectl tries to load the PulseAudio library on initialization, so a fake
 # module is set instead to prevent a failure when (indirectly) importing it if
@@ -30,8 +36,33 @@ import pytest
 sys.modules['pulsectl'] = {}
 
 # pylint: disable=wrong-import-position
-from nextcloud.talk.recording.Server import isAddressInNetworks, TrustedProxiesFix
+from nextcloud.talk.recording import Server
+from nextcloud.talk.recording.Config import BackendConfig, Config
+from nextcloud.talk.recording.Server import _AddressRanges, _DaemonThreadPool, _jsonResponse, _loadJson, _normalizeAddress, _parseAddress, _readBodyAndCalculateChecksum, _tryParseAddress, _validateRequest, app, isAddressInNetworks, ProtectedMetrics, TrustedProxiesFix
 
+# Several tests (and several cases of the same test) use the same networks, so
+# they are parsed only once for the whole test session.
+@pytest.fixture(scope='session', name='parseNetworks')
+def parseNetworksFixture():
+    networksByStrings = {}
+
+    def parseNetworks(networkStrings):
+        networkStrings = tuple(networkStrings)
+
+        if networkStrings not in networksByStrings:
+            networksByStrings[networkStrings] = tuple(ip_network(network) for network in networkStrings)
+
+        return networksByStrings[networkStrings]
+
+    return parseNetworks
+
+def isAddressInAddressRanges(address, networks):
+    return address in _AddressRanges(networks)
+
+@pytest.mark.parametrize('isAddressInNetworksFunction', [
+    isAddressInNetworks,
+    isAddressInAddressRanges,
+])
 @pytest.mark.parametrize('address, networks, expectedResult', [
     ('192.168.57.42', [], False),
     ('192.168.57.42', ['192.168.58.0/24'], False),
@@ -43,12 +74,479 @@ from nextcloud.talk.recording.Server import isAddressInNetworks, TrustedProxiesF
     ('192.168.59.42', ['192.168.58.0/24', '2001:db8::a00/120', '192.168.57.42', '2001:db8::b00/120'], False),
     ('2001:db8::abc', ['192.168.58.0/24', '2001:db8::a00/120', '192.168.57.42', '2001:db8::b00/120'], True),
     ('2001:db8::cbc', ['192.168.58.0/24', '2001:db8::a00/120', '192.168.57.42', '2001:db8::b00/120'], False),
+    # Overlapping and adjacent networks
+    ('192.168.57.42', ['192.168.0.0/16', '192.168.57.0/24'], True),
+    ('192.168.58.42', ['192.168.57.0/24', '192.168.0.0/16'], True),
+    ('192.168.59.42', ['192.168.57.0/24', '192.168.58.0/24'], False),
+    ('192.168.58.42', ['192.168.57.0/24', '192.168.58.0/24'], True),
+    ('192.168.56.255', ['192.168.57.0/24', '192.168.58.0/24'], False),
+    ('192.168.57.0', ['192.168.57.0/24', '192.168.58.0/24'], True),
+    ('192.168.58.255', ['192.168.57.0/24', '192.168.58.0/24'], True),
+    # The same address as integer in different IP versions
+    ('::c0a8:392a', ['192.168.57.42'], False),
+    ('192.168.57.42', ['::c0a8:392a'], False),
 ])
-def testIsAddressInNetworks(address, networks, expectedResult):
+def testIsAddressInNetworks(parseNetworks, isAddressInNetworksFunction, address, networks, expectedResult):
     address = ip_address(address)
-    networks = [ip_network(network) for network in networks]
+    networks = parseNetworks(networks)
+
+    assert isAddressInNetworksFunction(address, networks) == expectedResult
+
+@pytest.mark.parametrize('address', [
+    '192.168.57.42',
+    '0.0.0.0',
+    '255.255.255.255',
+    '::1',
+    '2001:db8::abc',
+    '::ffff:192.168.57.42',
+])
+def testParseAddress(address):
+    assert _parseAddress(address) == (ip_address(address).version, int(ip_address(address)))
+    assert _tryParseAddress(address) == (ip_address(address).version, int(ip_address(address)))
+
+@pytest.mark.parametrize('address', [
+    '',
+    'not-an-ip',
+    '192.168.57',
+    '192.168.57.42:12345',
+    '[::1]',
+    '2001:db8::abc::def',
+    '192.168.57.42\x00',
+    '2001:db8::abc\x00',
+])
+def testParseAddressInvalid(address):
+    with pytest.raises(ValueError):
+        _parseAddress(address)
+
+    assert _tryParseAddress(address) is None
+
+@pytest.mark.parametrize('address', [
+    '192.168.57.42',
+    '0.0.0.0',
+    '::1',
+    '2001:db8::abc',
+    '2001:0db8:0000:0000:0000:0000:0000:0abc',
+    '2001:DB8::ABC',
+    '::ffff:192.168.57.42',
+])
+def testNormalizeAddress(address):
+    version, _ = _parseAddress(address)
+
+    assert _normalizeAddress(address, version) == ip_address(address).compressed
+
+@pytest.mark.parametrize('address, expectedNormalizedAddress', [
+    ('fe80::1%eth0', 'fe80::1%eth0'),
+    ('FE80:0:0::1%3', 'fe80::1%3'),
+])
+def testParseAndNormalizeAddressWithScope(address, expectedNormalizedAddress):
+    assert _parseAddress(address) == (6, int(ip_address('fe80::1')))
+    assert _tryParseAddress(address) == (6, int(ip_address('fe80::1')))
+
+    assert _normalizeAddress(address, 6) == expectedNormalizedAddress
+
+@pytest.mark.parametrize('body, chunkSize', [
+    (b'{}', 65536),
+    (b'{"type": "start"}', 65536),
+    (b'{"type": "start"}', 4),
+    (b'{"type": "start"}', 1),
+])
+def testReadBodyAndCalculateChecksum(monkeypatch, body, chunkSize):
+    monkeypatch.setattr(Server, '_BODY_CHUNK_SIZE', chunkSize)
 
-    assert isAddressInNetworks(address, networks) == expectedResult
+    bodyChunks, checksum = _readBodyAndCalculateChecksum(b'the-secret', 'the-random', BytesIO(body), len(body))
+
+    assert b''.join(bodyChunks) == body
+    assert checksum == hmac.new(b'the-secret', b'the-random' + body, hashlib.sha256).digest()
+
+def testReadBodyAndCalculateChecksumWithShorterBody():
+    bodyChunks, checksum = _readBodyAndCalculateChecksum(b'the-secret', 'the-random', BytesIO(b'{}'), 1024)
+
+    assert b''.join(bodyChunks) == b'{}'
+    assert checksum == hmac.new(b'the-secret', b'the-random{}', hashlib.sha256).digest()
+
+@pytest.fixture(params=[True, False], ids=['orjson', 'json'])
+def useOrjson(request, monkeypatch):
+    if request.param and Server.orjson is None:
+        pytest.skip('orjson is not installed')
+
+    if not request.param:
+        monkeypatch.setattr(Server, 'orjson', None)
+
+    return request.param
+
+@pytest.mark.parametrize('data, expectedResult', [
+    (b'{}', {}),
+    (b'{"type": "start", "start": {"status": 1}}', {'type': 'start', 'start': {'status': 1}}),
+])
+@pytest.mark.usefixtures('useOrjson')
+def testLoadJson(data, expectedResult):
+    assert _loadJson(data) == expectedResult
+
+@pytest.mark.usefixtures('useOrjson')
+def testLoadJsonInvalid():
+    with pytest.raises(ValueError):
+        _loadJson(b'{"type": ')
+
+@pytest.mark.usefixtures('useOrjson')
+def testJsonResponse():
+    with app.app_context():
+        response = _jsonResponse(version='1.2.3')
+
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == {'version': '1.2.3'}
+
+# The cases of TrustedProxiesFixTest.testGetRemoteAddress, as
+# (remoteAddress, xForwardedFor, trustedProxies, expectedRemoteAddress) tuples.
+_GET_REMOTE_ADDRESS_CASES = [
+    # No trusted proxy
+    (
+        '4.8.15.16',
+        '',
+        '',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 10.11.12.13',
+        '',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16:12345',
+        '',
+        '',
+        '4.8.15.16:12345'
+    ),
+    (
+        '2001:db8:4815::16',
+        '',
+        '',
+        '2001:db8:4815::16'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108',
+        '',
+        '2001:db8:4815::16'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108, 2001:db8:1011::1213',
+        '',
+        '2001:db8:4815::16'
+    ),
+    (
+        '[2001:db8:4815::16]:12345',
+        '',
+        '',
+        '[2001:db8:4815::16]:12345'
+    ),
+    (
+        '4.8.15.16',
+        '2001:db8:2342::108',
+        '',
+        '4.8.15.16'
+    ),
+    (
+        '2001:db8:4815::16',
+        '23.42.108.0',
+        '',
+        '2001:db8:4815::16'
+    ),
+    # Trusted proxy not matching remote address
+    (
+        '4.8.15.16',
+        '',
+        '10.11.12.13',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '10.11.12.13',
+        '10.11.12.13',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '10.11.12.13',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 10.11.12.13',
+        '10.11.12.13',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 10.11.12.13',
+        '4.8.16.0/24, 10.11.12.13',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16:12345',
+        '',
+        '10.11.12.13',
+        '4.8.15.16:12345'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:1011::1213',
+        '2001:db8:1011::1213',
+        '2001:db8:4815::16'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108, 2001:db8:1011::1213',
+        '2001:db8:4816::0/48, 2001:db8:1011::1213',
+        '2001:db8:4815::16'
+    ),
+    (
+        '[2001:db8:4815::16]:12345',
+        '2001:db8:1011::1213',
+        '2001:db8:1011::1213',
+        '[2001:db8:4815::16]:12345'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 2001:db8:1011::1213',
+        '2001:db8:1011::1213',
+        '4.8.15.16'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108, 10.11.12.13',
+        '10.11.12.13',
+        '2001:db8:4815::16'
+    ),
+    # Trusted proxy matching remote address
+    (
+        '4.8.15.16',
+        '',
+        '4.8.15.16',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '4.8.15.16',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '4.8.15.0/24',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '10.11.12.13, 4.8.15.0/24',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '10.11.12.13, 4.8.15.0/24, 10.11.12.14',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '10.11.12.13, 23.42.108.0',
+        '4.8.15.16',
+        '23.42.108.0'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108',
+        '2001:db8:4815::16',
+        '2001:db8:2342::108'
+    ),
+    (
+        '4.8.15.16',
+        '2001:db8:2342::108',
+        '4.8.15.0/24',
+        '2001:db8:2342::108'
+    ),
+    (
+        '2001:db8:4815::16',
+        '23.42.108.0',
+        '2001:db8:4815::0/112',
+        '23.42.108.0'
+    ),
+    # Trusted proxy matching remote address and forwarded header
+    (
+        '4.8.15.16',
+        '23.42.108.0',
+        '4.8.15.16, 23.42.108.0',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 4.8.15.108',
+        '4.8.15.0/24',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 10.11.12.13',
+        '4.8.15.16, 10.11.12.13',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 10.11.12.13',
+        '10.11.12.13, 4.8.15.16',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '10.11.12.13, 23.42.108.0',
+        '4.8.15.16, 10.11.12.13',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, 10.11.12.13',
+        '4.8.15.16, 10.11.12.0/24',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '10.11.12.15, 23.42.108.0, 10.11.12.14, 10.11.12.13',
+        '4.8.15.16, 10.11.12.0/24',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '10.11.12.15, 23.42.108.0, 10.11.12.14, 10.11.12.13',
+        '4.8.15.16, 10.11.12.13, 10.11.12.14, 10.11.12.15',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16:12345',
+        '10.11.12.15:23456, 23.42.108.0:34567, 10.11.12.14:45678, 10.11.12.13:56789',
+        '4.8.15.16, 10.11.12.13, 10.11.12.14, 10.11.12.15',
+        '23.42.108.0'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108',
+        '2001:db8:4815::16, 2001:db8:2342::108',
+        '2001:db8:2342::108'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:1011::1215, 2001:db8:2342::108, 2001:db8:1011::1214, 2001:db8:1011::1213',
+        '2001:db8:1011::0/48, 2001:db8:4815::16',
+        '2001:db8:2342::108'
+    ),
+    (
+        '4.8.15.16',
+        '10.11.12.15, 2001:db8:2342::108, 10.11.12.14, 2001:db8:1011::1213',
+        '2001:db8:1011::0/48, 4.8.15.16, 10.11.12.14',
+        '2001:db8:2342::108'
+    ),
+    (
+        '2001:db8:4815::16',
+        '10.11.12.15, 23.42.108.0, 2001:db8:1011::1214, 10.11.12.13',
+        '10.11.12.13, 2001:db8::0/32',
+        '23.42.108.0'
+    ),
+    (
+        '[2001:db8:4815::16]:12345',
+        '10.11.12.15:23456, 23.42.108.0:34567, [2001:db8:1112::1314], [2001:db8:1011::1214]:45678, 10.11.12.13:56789',
+        '10.11.12.13, 2001:db8::0/32',
+        '23.42.108.0'
+    ),
+    # Invalid IP in forwarded header
+    (
+        '4.8.15.16',
+        'not-an-ip',
+        '4.8.15.0/24',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, not-an-ip',
+        '4.8.15.0/24',
+        '4.8.15.16'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, not-an-ip, 4.8.15.108',
+        '4.8.15.0/24',
+        '4.8.15.108'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108, not-an-ip, 2001:db8:4815::108',
+        '2001:db8:4815::0/112',
+        '2001:db8:4815::108'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, not-an-ip, 2001:db8:4815::108',
+        '4.8.15.16, 2001:db8:4815::108',
+        '2001:db8:4815::108'
+    ),
+    (
+        '2001:db8:4815::16',
+        '2001:db8:2342::108, not-an-ip, 4.8.15.108',
+        '2001:db8:4815::16, 4.8.15.108',
+        '4.8.15.108'
+    ),
+    (
+        '2001:db8:4815::16',
+        ',,not-an-ip,,2001:db8:2342::108,,,     ,    4.8.15.108   ',
+        '2001:db8:4815::16, 4.8.15.108',
+        '4.8.15.108'
+    ),
+    # Scoped IPv6 addresses
+    (
+        '[fe80::16%eth0]:12345',
+        '23.42.108.0',
+        'fe80::0/64',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        '23.42.108.0, fe80::1%eth0',
+        '4.8.15.16, fe80::0/64',
+        '23.42.108.0'
+    ),
+    (
+        '4.8.15.16',
+        'FE80::1%eth0',
+        '4.8.15.16',
+        'fe80::1%eth0'
+    ),
+    # Null character in forwarded header
+    (
+        '4.8.15.16',
+        '1.2.3.4\x00',
+        '4.8.15.0/24',
+        '4.8.15.16'
+    ),
+    (
+        '2001:db8:4815::16',
+        '23.42.108.0, 2001:db8:2342::108\x00, 2001:db8:4815::108',
+        '2001:db8:4815::0/112',
+        '2001:db8:4815::108'
+    ),
+]
+
+def _getRemoteAddressCaseId(case):
+    remoteAddress, xForwardedFor, trustedProxies, _ = case
+
+    return f"{remoteAddress}|{xForwardedFor.replace(' ', '') or '-'}|{trustedProxies.replace(' ', '') or '-'}"
 
 class TrustedProxiesFixTest:
 
@@ -56,340 +554,92 @@ class TrustedProxiesFixTest:
     def fakeConfig(self):
         class FakeConfig:
             def __init__(self):
+                self.generation = 1
                 self.trustedProxies = []
 
+            def getGeneration(self):
+                return self.generation
+
             def getTrustedProxies(self):
                 return self.trustedProxies
 
         return FakeConfig()
 
-    @pytest.mark.parametrize('remoteAddress, xForwardedFor, trustedProxies, expectedRemoteAddress', [
-        # No trusted proxy
-        (
-            '4.8.15.16',
-            '',
-            '',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 10.11.12.13',
-            '',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16:12345',
-            '',
-            '',
-            '4.8.15.16:12345'
-        ),
-        (
-            '2001:db8:4815::16',
-            '',
-            '',
-            '2001:db8:4815::16'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108',
-            '',
-            '2001:db8:4815::16'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108, 2001:db8:1011::1213',
-            '',
-            '2001:db8:4815::16'
-        ),
-        (
-            '[2001:db8:4815::16]:12345',
-            '',
-            '',
-            '[2001:db8:4815::16]:12345'
-        ),
-        (
-            '4.8.15.16',
-            '2001:db8:2342::108',
-            '',
-            '4.8.15.16'
-        ),
-        (
-            '2001:db8:4815::16',
-            '23.42.108.0',
-            '',
-            '2001:db8:4815::16'
-        ),
-        # Trusted proxy not matching remote address
-        (
-            '4.8.15.16',
-            '',
-            '10.11.12.13',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '10.11.12.13',
-            '10.11.12.13',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '10.11.12.13',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 10.11.12.13',
-            '10.11.12.13',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 10.11.12.13',
-            '4.8.16.0/24, 10.11.12.13',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16:12345',
-            '',
-            '10.11.12.13',
-            '4.8.15.16:12345'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:1011::1213',
-            '2001:db8:1011::1213',
-            '2001:db8:4815::16'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108, 2001:db8:1011::1213',
-            '2001:db8:4816::0/48, 2001:db8:1011::1213',
-            '2001:db8:4815::16'
-        ),
-        (
-            '[2001:db8:4815::16]:12345',
-            '2001:db8:1011::1213',
-            '2001:db8:1011::1213',
-            '[2001:db8:4815::16]:12345'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 2001:db8:1011::1213',
-            '2001:db8:1011::1213',
-            '4.8.15.16'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108, 10.11.12.13',
-            '10.11.12.13',
-            '2001:db8:4815::16'
-        ),
-        # Trusted proxy matching remote address
-        (
-            '4.8.15.16',
-            '',
-            '4.8.15.16',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '4.8.15.16',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '4.8.15.0/24',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '10.11.12.13, 4.8.15.0/24',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '10.11.12.13, 4.8.15.0/24, 10.11.12.14',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '10.11.12.13, 23.42.108.0',
-            '4.8.15.16',
-            '23.42.108.0'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108',
-            '2001:db8:4815::16',
-            '2001:db8:2342::108'
-        ),
-        (
-            '4.8.15.16',
-            '2001:db8:2342::108',
-            '4.8.15.0/24',
-            '2001:db8:2342::108'
-        ),
-        (
-            '2001:db8:4815::16',
-            '23.42.108.0',
-            '2001:db8:4815::0/112',
-            '23.42.108.0'
-        ),
-        # Trusted proxy matching remote address and forwarded header
-        (
-            '4.8.15.16',
-            '23.42.108.0',
-            '4.8.15.16, 23.42.108.0',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 4.8.15.108',
-            '4.8.15.0/24',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 10.11.12.13',
-            '4.8.15.16, 10.11.12.13',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 10.11.12.13',
-            '10.11.12.13, 4.8.15.16',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '10.11.12.13, 23.42.108.0',
-            '4.8.15.16, 10.11.12.13',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, 10.11.12.13',
-            '4.8.15.16, 10.11.12.0/24',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '10.11.12.15, 23.42.108.0, 10.11.12.14, 10.11.12.13',
-            '4.8.15.16, 10.11.12.0/24',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16',
-            '10.11.12.15, 23.42.108.0, 10.11.12.14, 10.11.12.13',
-            '4.8.15.16, 10.11.12.13, 10.11.12.14, 10.11.12.15',
-            '23.42.108.0'
-        ),
-        (
-            '4.8.15.16:12345',
-            '10.11.12.15:23456, 23.42.108.0:34567, 10.11.12.14:45678, 10.11.12.13:56789',
-            '4.8.15.16, 10.11.12.13, 10.11.12.14, 10.11.12.15',
-            '23.42.108.0'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108',
-            '2001:db8:4815::16, 2001:db8:2342::108',
-            '2001:db8:2342::108'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:1011::1215, 2001:db8:2342::108, 2001:db8:1011::1214, 2001:db8:1011::1213',
-            '2001:db8:1011::0/48, 2001:db8:4815::16',
-            '2001:db8:2342::108'
-        ),
-        (
-            '4.8.15.16',
-            '10.11.12.15, 2001:db8:2342::108, 10.11.12.14, 2001:db8:1011::1213',
-            '2001:db8:1011::0/48, 4.8.15.16, 10.11.12.14',
-            '2001:db8:2342::108'
-        ),
-        (
-            '2001:db8:4815::16',
-            '10.11.12.15, 23.42.108.0, 2001:db8:1011::1214, 10.11.12.13',
-            '10.11.12.13, 2001:db8::0/32',
-            '23.42.108.0'
-        ),
-        (
-            '[2001:db8:4815::16]:12345',
-            '10.11.12.15:23456, 23.42.108.0:34567, [2001:db8:1112::1314], [2001:db8:1011::1214]:45678, 10.11.12.13:56789',
-            '10.11.12.13, 2001:db8::0/32',
-            '23.42.108.0'
-        ),
-        # Invalid IP in forwarded header
-        (
-            '4.8.15.16',
-            'not-an-ip',
-            '4.8.15.0/24',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, not-an-ip',
-            '4.8.15.0/24',
-            '4.8.15.16'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, not-an-ip, 4.8.15.108',
-            '4.8.15.0/24',
-            '4.8.15.108'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108, not-an-ip, 2001:db8:4815::108',
-            '2001:db8:4815::0/112',
-            '2001:db8:4815::108'
-        ),
-        (
-            '4.8.15.16',
-            '23.42.108.0, not-an-ip, 2001:db8:4815::108',
-            '4.8.15.16, 2001:db8:4815::108',
-            '2001:db8:4815::108'
-        ),
-        (
-            '2001:db8:4815::16',
-            '2001:db8:2342::108, not-an-ip, 4.8.15.108',
-            '2001:db8:4815::16, 4.8.15.108',
-            '4.8.15.108'
-        ),
-        (
-            '2001:db8:4815::16',
-            ',,not-an-ip,,2001:db8:2342::108,,,     ,    4.8.15.108   ',
-            '2001:db8:4815::16, 4.8.15.108',
-            '4.8.15.108'
-        ),
-    ])
-    def testGetRemoteAddress(self, fakeConfig, remoteAddress, xForwardedFor, trustedProxies, expectedRemoteAddress):
+    # The values of each case are given in a single parameter, so the id can
+    # be got from the whole case.
+    @pytest.mark.parametrize('case', _GET_REMOTE_ADDRESS_CASES, ids=_getRemoteAddressCaseId)
+    def testGetRemoteAddress(self, fakeConfig, parseNetworks, case):
+        remoteAddress, xForwardedFor, trustedProxies, expectedRemoteAddress = case
+
         environment = {
             'REMOTE_ADDR': remoteAddress,
         }
         if xForwardedFor:
             environment['HTTP_X_FORWARDED_FOR'] = xForwardedFor
 
-        trustedProxies = [ip_network(trustedProxy.strip()) for trustedProxy in trustedProxies.split(',') if trustedProxy]
-        fakeConfig.trustedProxies = trustedProxies
+        fakeConfig.trustedProxies = parseNetworks(trustedProxy.strip() for trustedProxy in trustedProxies.split(',') if trustedProxy)
 
         trustedProxiesFix = TrustedProxiesFix(None, fakeConfig)
 
         assert trustedProxiesFix.getRemoteAddress(environment) == expectedRemoteAddress
 
+    def testGetRemoteAddressGetsTrustedProxiesOnlyOnce(self, fakeConfig):
+        environment = {
+            'REMOTE_ADDR': '4.8.15.16',
+            'HTTP_X_FORWARDED_FOR': '23.42.108.0',
+        }
+
+        fakeConfig.trustedProxies = [ip_network('4.8.15.16')]
+
+        trustedProxiesFix = TrustedProxiesFix(None, fakeConfig)
+
+        assert trustedProxiesFix.getRemoteAddress(environment) == '23.42.108.0'
+
+        fakeConfig.trustedProxies = []
+
+        assert trustedProxiesFix.getRemoteAddress(environment) == '23.42.108.0'
+
+    def testGetRemoteAddressGetsTrustedProxiesAgainWhenConfigurationIsLoadedAgain(self, fakeConfig):
+        environment = {
+            'REMOTE_ADDR': '4.8.15.16',
+            'HTTP_X_FORWARDED_FOR': '23.42.108.0',
+        }
+
+        fakeConfig.trustedProxies = [ip_network('4.8.15.16')]
+
+        trustedProxiesFix = TrustedProxiesFix(None, fakeConfig)
+
+        assert trustedProxiesFix.getRemoteAddress(environment) == '23.42.108.0'
+
+        fakeConfig.trustedProxies = []
+        fakeConfig.generation += 1
+
+        assert trustedProxiesFix.getRemoteAddress(environment) == '4.8.15.16'
+
+    @pytest.mark.parametrize('trustedProxies, expectedRemoteAddress', [
+        ([], '4.8.15.16'),
+        ([ip_network('4.8.15.16')], '23.42.108.0'),
+    ])
+    def testCall(self, fakeConfig, trustedProxies, expectedRemoteAddress):
+        environment = {
+            'REMOTE_ADDR': '4.8.15.16',
+            'HTTP_X_FORWARDED_FOR': '23.42.108.0',
+        }
+
+        fakeConfig.trustedProxies = trustedProxies
+
+        remoteAddresses = []
+
+        def fakeApp(environment, startResponse): # pylint: disable=unused-argument
+            remoteAddresses.append(environment['REMOTE_ADDR'])
+
+            return []
+
+        trustedProxiesFix = TrustedProxiesFix(fakeApp, fakeConfig)
+        trustedProxiesFix(environment, None)
+
+        assert remoteAddresses == [expectedRemoteAddress]
+
     def testGetRemoteAddressWithoutOriginalRemoteAddress(self, fakeConfig):
         trustedProxiesFix = TrustedProxiesFix(None, fakeConfig)
 
@@ -404,6 +654,16 @@ class TrustedProxiesFixTest:
                 'REMOTE_ADDR': '',
             })
 
+    def testGetRemoteAddressWithoutTrustedProxiesDoesNotParseAddresses(self, fakeConfig):
+        trustedProxiesFix = TrustedProxiesFix(None, fakeConfig)
+
+        # Neither the original remote address nor the "X-Forwarded-For" header
+        # are parsed, so invalid values are returned as is.
+        assert trustedProxiesFix.getRemoteAddress({
+            'REMOTE_ADDR': 'not-an-ip',
+            'HTTP_X_FORWARDED_FOR': 'not-an-ip-either',
+        }) == 'not-an-ip'
+
     @pytest.mark.parametrize('address, expectedAddress', [
         ('192.168.0.42', '192.168.0.42'),
         ('192.168.0.42:12345', '192.168.0.42'),
@@ -420,9 +680,309 @@ class TrustedProxiesFixTest:
         ('not-an-ip:at-all', 'not-an-ip'),
         ('not:an:ip::at-all', 'not:an:ip::at-all'),
         ('[not:an:ip][very][::weird]', 'not:an:ip][very][::weird'),
+        ('[not:an:ip][very]:weird', 'not:an:ip][very'),
+        ('[not:an:ip', '[not:an:ip'),
     ])
     def testGetAddressWithoutPort(self, fakeConfig, address, expectedAddress):
         trustedProxiesFix = TrustedProxiesFix(None, fakeConfig)
 
         # pylint: disable=protected-access
         assert trustedProxiesFix._getAddressWithoutPort(address) == expectedAddress
+
+class ProtectedMetricsTest:
+
+    @pytest.fixture
+    def fakeConfig(self):
+        class FakeConfig:
+            def __init__(self):
+                self.generation = 1
+                self.statsAllowedIps = []
+
+            def getGeneration(self):
+                return self.generation
+
+            def getStatsAllowedIps(self):
+                return self.statsAllowedIps
+
+        return FakeConfig()
+
+    @pytest.mark.parametrize('remoteAddress, statsAllowedIps, expectedAllowed', [
+        ('127.0.0.1', ['127.0.0.1'], True),
+        ('127.0.0.2', ['127.0.0.1'], False),
+        ('192.168.57.42', ['127.0.0.1', '192.168.57.0/24'], True),
+        ('::1', ['127.0.0.1'], False),
+        ('::1', ['127.0.0.1', '::1'], True),
+        ('2001:db8::abc', ['2001:db8::a00/120'], True),
+    ])
+    def testCall(self, fakeConfig, remoteAddress, statsAllowedIps, expectedAllowed):
+        fakeConfig.statsAllowedIps = [ip_network(statsAllowedIp) for statsAllowedIp in statsAllowedIps]
+
+        protectedMetrics = ProtectedMetrics(fakeConfig)
+        protectedMetrics.metrics = lambda environment, startResponse: ['metrics']
+
+        statuses = []
+
+        result = protectedMetrics({'REMOTE_ADDR': remoteAddress}, lambda status, headers: statuses.append(status))
+
+        if expectedAllowed:
+            assert result == ['metrics']
+            assert not statuses
+        else:
+            assert not result
+            assert statuses == ['403 FORBIDDEN']
+
+    def testCallGetsAllowedIpsAgainWhenConfigurationIsLoadedAgain(self, fakeConfig):
+        fakeConfig.statsAllowedIps = [ip_network('127.0.0.1')]
+
+        protectedMetrics = ProtectedMetrics(fakeConfig)
+        protectedMetrics.metrics = lambda environment, startResponse: ['metrics']
+
+        assert not protectedMetrics({'REMOTE_ADDR': '127.0.0.2'}, lambda status, headers: None)
+
+        fakeConfig.statsAllowedIps = [ip_network('127.0.0.2')]
+
+        assert not protectedMetrics({'REMOTE_ADDR': '127.0.0.2'}, lambda status, headers: None)
+
+        fakeConfig.generation += 1
+
+        assert protectedMetrics({'REMOTE_ADDR': '127.0.0.2'}, lambda status, headers: None) == ['metrics']
+
+class ValidateRequestTest:
+
+    @pytest.fixture(autouse=True)
+    def fakeConfig(self, monkeypatch):
+        class FakeConfig:
+            def getBackendConfig(self, backendUrl):
+                secret = 'the-secret' if backendUrl == 'https://cloud.server.com' else None
+
+                return BackendConfig(
+                    secret=secret,
+                    secretBytes=secret.encode() if secret is not None else None,
+                    skipVerify=False,
+                    maximumMessageSize=1024,
+                    videoWidth=1920,
+                    videoHeight=1080,
+                    directory='/tmp',
+                )
+
+        monkeypatch.setattr(Server, 'config', FakeConfig())
+
+    def getHeaders(self, body, **overrides):
+        headers = {
+            'Talk-Recording-Backend': 'https://cloud.server.com',
+            'Talk-Recording-Random': 'the-random',
+            'Talk-Recording-Checksum': hmac.new(b'the-secret', b'the-random' + body, hashlib.sha256).hexdigest(),
+        }
+        headers.update(overrides)
+
+        return {name: value for name, value in headers.items() if value is not None}
+
+    def testValidateRequest(self):
+        body = b'{"type": "start"}'
+
+        with app.test_request_context(method='POST', data=body, headers=self.getHeaders(body)):
+            assert _validateRequest() == ('https://cloud.server.com', {'type': 'start'})
+
+    @pytest.mark.parametrize('overrides', [
+        {'Talk-Recording-Backend': None},
+        {'Talk-Recording-Backend': 'https://cloud.unknown.com'},
+        {'Talk-Recording-Random': None},
+        {'Talk-Recording-Random': 'another-random'},
+        {'Talk-Recording-Checksum': None},
+        {'Talk-Recording-Checksum': 'not-hex'},
+        {'Talk-Recording-Checksum': '0123456789abcdef'},
+    ])
+    def testValidateRequestForbidden(self, overrides):
+        body = b'{"type": "start"}'
+
+        with app.test_request_context(method='POST', data=body, headers=self.getHeaders(body, **overrides)):
+            with pytest.raises(Forbidden):
+                _validateRequest()
+
+    @pytest.mark.parametrize('modifyChecksum', [
+        str.upper,
+        lambda checksum: checksum[:32] + ' ' + checksum[32:],
+        lambda checksum: checksum[:32] + ' ' + checksum[33:],
+        lambda checksum: checksum + '00',
+    ], ids=['uppercase', 'whitespace-added', 'whitespace-replacing', 'longer'])
+    def testValidateRequestForbiddenWithNonCanonicalChecksum(self, modifyChecksum):
+        body = b'{"type": "start"}'
+        headers = self.getHeaders(body)
+        headers['Talk-Recording-Checksum'] = modifyChecksum(headers['Talk-Recording-Checksum'])
+
+        with app.test_request_context(method='POST', data=body, headers=headers):
+            with pytest.raises(Forbidden):
+                _validateRequest()
+
+    def testValidateRequestAboveMaximumMessageSize(self):
+        body = b'{"type": "start", "padding": "' + b'x' * 1024 + b'"}'
+
+        with app.test_request_context(method='POST', data=body, headers=self.getHeaders(body)):
+            with pytest.raises(BadRequest):
+                _validateRequest()
+
+    @pytest.mark.parametrize('configString', [
+        """
+[backend]
+backends = backend1
+
+[backend1]
+url = https://cloud.server.com
+secret = the-secret
+""",
+        """
+[backend]
+allowall = true
+secret = the-common-secret
+""",
+    ])
+    def testHandleBackendRequestWithMalformedBackend(self, monkeypatch, configString):
+        config = Config()
+        config.loadFromString(configString)
+        monkeypatch.setattr(Server, 'config', config)
+
+        body = b'{"type": "start"}'
+        headers = self.getHeaders(body, **{'Talk-Recording-Backend': 'http://[abc'})
+
+        response = app.test_client().post('/api/v1/room/the-token', data=body, headers=headers)
+
+        assert response.status_code == 403
+
+class StartRecordingTest:
+
+    @pytest.fixture(name='submittedTasks')
+    def submittedTasksFixture(self, monkeypatch):
+        class FakeService:
+            def __init__(self, backend, token, status, owner):
+                # pylint: disable=unused-argument
+                self.backend = backend
+                self.token = token
+
+        class FakeThreadPool:
+            def __init__(self):
+                self.tasks = []
+
+            def submit(self, function, *args):
+                self.tasks.append((function, args))
+
+        fakeThreadPool = FakeThreadPool()
+
+        monkeypatch.setattr(Server, 'Service', FakeService)
+        monkeypatch.setattr(Server, 'services', {})
+        monkeypatch.setattr(Server, 'servicesStartThreadPool', fakeThreadPool)
+
+        return fakeThreadPool.tasks
+
+    def setMaximumConcurrentRecordings(self, monkeypatch, maximumConcurrentRecordings):
+        class FakeConfig:
+            def getMaximumConcurrentRecordings(self):
+                return maximumConcurrentRecordings
+
+        monkeypatch.setattr(Server, 'config', FakeConfig())
+
+    def startRecording(self, token):
+        return Server.startRecording('https://cloud.server.com', token, {
+            'start': {
+                'owner': 'the-owner',
+                'actor': {
+                    'type': 'users',
+                    'id': 'the-actor',
+                },
+            },
+        })
+
+    def testStartRecordingWithoutMaximum(self, monkeypatch, submittedTasks):
+        self.setMaximumConcurrentRecordings(monkeypatch, 0)
+
+        for index in range(64):
+            assert not self.startRecording(f'token{index}')
+
+        assert len(submittedTasks) == 64
+
+    def testStartRecordingWhenMaximumIsReached(self, monkeypatch, submittedTasks):
+        self.setMaximumConcurrentRecordings(monkeypatch, 2)
+
+        assert not self.startRecording('token1')
+        assert not self.startRecording('token2')
+
+        with pytest.raises(ServiceUnavailable):
+            self.startRecording('token3')
+
+        assert len(submittedTasks) == 2
+
+        Server.services.pop(('https://cloud.server.com', 'token1'))
+
+        assert not self.startRecording('token3')
+
+        assert len(submittedTasks) == 3
+
+    def testStartRecordingServiceWhenStoppedBeforeStarting(self, monkeypatch, submittedTasks):
+        self.setMaximumConcurrentRecordings(monkeypatch, 0)
+
+        self.startRecording('token1')
+
+        function, args = submittedTasks[0]
+        service = args[0]
+
+        Server.services.pop(('https://cloud.server.com', 'token1'))
+
+        total = Server.metricsRecordingsTotal.labels(service.backend)._value.get() # pylint: disable=protected-access
+
+        # The service is not started, so it does not need a real Service.
+        function(*args)
+
+        assert Server.metricsRecordingsTotal.labels(service.backend)._value.get() == total # pylint: disable=protected-access
+
+class DaemonThreadPoolTest:
+
+    def testSubmit(self):
+        threadPool = _DaemonThreadPool('test')
+
+        done = Event()
+        results = []
+
+        def task(value):
+            results.append((value, current_thread().daemon))
+            done.set()
+
+        threadPool.submit(task, 42)
+
+        assert done.wait(5)
+        assert results == [(42, True)]
+
+    def testSubmitReusesThreads(self):
+        threadPool = _DaemonThreadPool('test')
+
+        threadNames = set()
+        for _ in range(3):
+            done = Event()
+            threadPool.submit(lambda done: (threadNames.add(current_thread().name), done.set()), done)
+
+            assert done.wait(5)
+
+            # Wait for the thread to be idle again.
+            for _ in range(500):
+                if threadPool._idleThreads > 0: # pylint: disable=protected-access
+                    break
+
+                sleep(0.01)
+
+        assert len(threadNames) == 1
+
+    def testSubmitDoesNotWaitWhenAllAreBusy(self):
+        threadPool = _DaemonThreadPool('test')
+
+        barrier = Barrier(4)
+        release = Event()
+
+        def blockingTask():
+            barrier.wait(5)
+            release.wait(5)
+
+        for _ in range(3):
+            threadPool.submit(blockingTask)
+
+        # All the tasks are running at the same time.
+        barrier.wait(5)
+
+        release.set()